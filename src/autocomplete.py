@@ -0,0 +1,167 @@
+"""
+In-memory prefix index of the product names, for type-ahead suggestions
+
+Every word of a product name starts a key, the rest of the normalized
+name from that word on, so "choc" suggests "Ferrero Rocher Hazelnut
+Chocolates".  The keys are kept in one sorted list, with the product of
+each key in a parallel array, and the keys starting with a prefix are
+found with bisect.  Keys are cut to SUGGEST_KEY_LENGTH characters, so
+the memory used does not grow with the length of the names.
+
+The index is read from the products table the first time it is used.
+The product routes update it in place after they commit, and it is read
+again when another worker changes the catalog.
+"""
+
+import bisect
+import heapq
+import re
+import sys
+from array import array
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.catalog_version import catalog_version
+from src.models import ProductBase
+
+SUGGEST_KEY_LENGTH = 32
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+
+
+def normalize(text: str) -> str:
+    """Lower case words separated by a single space"""
+    return " ".join(re.findall(r"\w+", text.casefold()))
+
+
+def name_keys(name: str) -> list[str]:
+    normalized = normalize(name)
+    return [
+        normalized[match.start() : match.start() + SUGGEST_KEY_LENGTH]
+        for match in re.finditer(r"\w+", normalized)
+    ]
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    product_id: int
+    name: str
+    rank: int
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self.keys: list[str] = []
+        # product_id of the key at the same position
+        self.key_product_ids = array("q")
+        self.products: dict[int, Suggestion] = {}
+        self.loaded = False
+        # incremented by every invalidate, so an index that was being read
+        # while a write committed is not kept
+        self.version = 0
+
+    def invalidate(self) -> None:
+        self.version += 1
+        self.keys = []
+        self.key_product_ids = array("q")
+        self.products = {}
+        self.loaded = False
+
+    async def load(self, db: AsyncSession) -> None:
+        await catalog_version.check(db)
+        if self.loaded:
+            return
+        version = self.version
+        rows = await db.execute(
+            select(ProductBase.product_id, ProductBase.name, ProductBase.rank)
+        )
+        products = {row.product_id: Suggestion(*row) for row in rows}
+        entries = sorted(
+            (key, product.product_id)
+            for product in products.values()
+            for key in name_keys(product.name)
+        )
+        if version != self.version:
+            return
+        self.products = products
+        self.keys = [key for key, _ in entries]
+        self.key_product_ids = array("q", (product_id for _, product_id in entries))
+        self.loaded = True
+
+    def add(self, product_id: int, name: str, rank: int) -> None:
+        if not self.loaded:
+            # a load in progress may have read the products before the write
+            self.version += 1
+            return
+        self.remove(product_id)
+        self.products[product_id] = Suggestion(product_id, name, rank)
+        for key in name_keys(name):
+            position = bisect.bisect_right(self.keys, key)
+            self.keys.insert(position, key)
+            self.key_product_ids.insert(position, product_id)
+
+    def remove(self, product_id: int) -> None:
+        if not self.loaded:
+            self.version += 1
+            return
+        product = self.products.pop(product_id, None)
+        if product is None:
+            return
+        for key in name_keys(product.name):
+            position = bisect.bisect_left(self.keys, key)
+            while self.key_product_ids[position] != product_id:
+                position += 1
+            del self.keys[position]
+            del self.key_product_ids[position]
+
+    def suggest(
+        self, prefix: str, limit: int = DEFAULT_SUGGESTIONS
+    ) -> list[Suggestion]:
+        """The products with a word starting with prefix, best ranked first"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        key_prefix = prefix[:SUGGEST_KEY_LENGTH]
+        start = bisect.bisect_left(self.keys, key_prefix)
+        product_ids = set()
+        for position in range(start, len(self.keys)):
+            if not self.keys[position].startswith(key_prefix):
+                break
+            product_ids.add(self.key_product_ids[position])
+        products = [self.products[product_id] for product_id in product_ids]
+        if len(prefix) > SUGGEST_KEY_LENGTH:
+            # the keys only had the start of the prefix
+            products = [
+                product
+                for product in products
+                if f" {prefix}" in f" {normalize(product.name)}"
+            ]
+        return heapq.nsmallest(
+            limit, products, key=lambda product: (product.rank, product.name)
+        )
+
+    def memory_size(self) -> int:
+        """Approximate bytes used by the index"""
+        return (
+            sys.getsizeof(self.keys)
+            + sum(sys.getsizeof(key) for key in self.keys)
+            + sys.getsizeof(self.key_product_ids)
+            + sys.getsizeof(self.products)
+            + sum(
+                sys.getsizeof(product) + sys.getsizeof(product.name)
+                for product in self.products.values()
+            )
+        )
+
+    def stats(self) -> dict:
+        return {
+            "products": len(self.products),
+            "keys": len(self.keys),
+            "bytes": self.memory_size(),
+        }
+
+
+autocomplete_index = AutocompleteIndex()
+catalog_version.on_change(autocomplete_index.invalidate)
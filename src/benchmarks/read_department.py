@@ -0,0 +1,150 @@
+"""
+Loading strategies of GET /departments/{id}?with_aisles_and_products=true
+
+    python -m src.benchmarks.read_department [--repeat 20]
+
+Every department of costco.db is loaded with each strategy:
+
+    joinedload("*")     the original router, every relationship joined
+    nested joinedload   aisles and products joined, sections not loaded
+                        (the first async version of the router)
+    selectinload        department_tree_options, the router now
+
+For each strategy the number of statements, the rows and values SQLite
+returned for them, and the median time of loading all the departments
+are printed.
+"""
+
+import argparse
+import statistics
+import time
+from typing import Callable
+
+from sqlalchemy import Engine, event, select
+from sqlalchemy.orm import Session, joinedload
+
+from src.database import engine
+from src.models import Aisle, Department, Product
+from src.routers.departments import department_tree_options
+
+
+def joinedload_all_options() -> tuple:
+    return (joinedload("*"),)
+
+
+def nested_joinedload_options() -> tuple:
+    return (
+        joinedload(Department.aisles)
+        .joinedload(Aisle.products)
+        .noload(Product.featured_products),
+        joinedload(Department.aisles)
+        .joinedload(Aisle.products)
+        .noload(Product.related_items),
+        joinedload(Department.aisles)
+        .joinedload(Aisle.products)
+        .noload(Product.often_bought_with),
+    )
+
+
+STRATEGIES: dict[str, Callable[[], tuple]] = {
+    'joinedload("*")': joinedload_all_options,
+    "nested joinedload": nested_joinedload_options,
+    "selectinload": department_tree_options,
+}
+
+
+def load_department(session: Session, department_id: int, options: tuple) -> int:
+    """Load the tree like the router, returns the number of products"""
+    department = (
+        session.scalars(
+            select(Department)
+            .options(*options)
+            .filter(Department.department_id == department_id)
+        )
+        .unique()
+        .first()
+    )
+    department.href
+    count = 0
+    for aisle in department.aisles:
+        aisle.href
+        for product in aisle.products:
+            product.href
+            count += 1
+    return count
+
+
+def load_all(bind: Engine, department_ids: list[int], options: tuple) -> int:
+    count = 0
+    for department_id in department_ids:
+        with Session(bind) as session:
+            count += load_department(session, department_id, options)
+    return count
+
+
+def count_rows(bind: Engine, department_ids: list[int], options: tuple) -> tuple:
+    """
+    Returns the number of statements, of rows they return, and of values
+    (rows x columns) in those rows
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(bind, "before_cursor_execute", record)
+    try:
+        load_all(bind, department_ids, options)
+    finally:
+        event.remove(bind, "before_cursor_execute", record)
+    rows = values = 0
+    with bind.connect() as connection:
+        for statement, parameters in statements:
+            result = connection.exec_driver_sql(statement, parameters)
+            columns = len(result.keys())
+            fetched = len(result.all())
+            rows += fetched
+            values += fetched * columns
+    return len(statements), rows, values
+
+
+def benchmark(bind: Engine = engine, repeat: int = 20) -> dict[str, dict]:
+    with Session(bind) as session:
+        department_ids = list(
+            session.scalars(select(Department.department_id).order_by(Department.rank))
+        )
+    results = {}
+    for name, strategy in STRATEGIES.items():
+        options = strategy()
+        statements, rows, values = count_rows(bind, department_ids, options)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            products = load_all(bind, department_ids, options)
+            times.append(time.perf_counter() - start)
+        results[name] = {
+            "departments": len(department_ids),
+            "products": products,
+            "statements": statements,
+            "rows": rows,
+            "values": values,
+            "median_ms": statistics.median(times) * 1000,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    results = benchmark(repeat=args.repeat)
+    print(
+        f"{'strategy':<20}{'statements':>12}{'rows':>8}{'values':>9}"
+        f"{'median ms':>12}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<20}{result['statements']:>12}{result['rows']:>8}"
+            f"{result['values']:>9}"
+            f"{result['median_ms']:>12.1f}"
+        )
@@ -0,0 +1,91 @@
+"""
+Serialization of GET /products/
+
+    python -m src.benchmarks.serialization [--limit 1000] [--repeat 50]
+
+A page of products is loaded from costco.db once, then encoded like the
+route did before, with jsonable_encoder on the ORM objects and the
+default JSONResponse, and like it does now, validating ProductSchema
+models from the ORM objects and rendering them with ORJSONResponse.
+The median time and size of each is printed.
+"""
+
+import argparse
+import statistics
+import time
+from typing import Callable
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from src.database import engine
+from src.models import Product
+from src.pagination import make_page
+from src.schemas import Page, ProductSchema
+
+page_adapter = TypeAdapter(Page[ProductSchema])
+
+
+def page_key(product) -> tuple:
+    return product.aisle_id, product.rank, product.product_id
+
+
+def encode_orm(products: list[Product], limit: int) -> bytes:
+    page = make_page(products, limit, page_key)
+    return JSONResponse(jsonable_encoder(page)).body
+
+
+def encode_schemas(products: list[Product], limit: int) -> bytes:
+    items = [ProductSchema.model_validate(product) for product in products]
+    page = make_page(items, limit, page_key)
+    # FastAPI validates the returned value against the response model,
+    # then serializes it to JSON compatible data
+    content = page_adapter.dump_python(page_adapter.validate_python(page), mode="json")
+    return ORJSONResponse(content).body
+
+
+ENCODERS: dict[str, Callable[[list[Product], int], bytes]] = {
+    "orm + JSONResponse": encode_orm,
+    "schemas + orjson": encode_schemas,
+}
+
+
+def benchmark(limit: int = 1000, repeat: int = 50) -> dict[str, dict]:
+    with Session(engine) as session:
+        products = list(
+            session.scalars(
+                select(Product)
+                .order_by(Product.aisle_id, Product.rank, Product.product_id)
+                .limit(limit + 1)
+            )
+        )
+        results = {}
+        for name, encode in ENCODERS.items():
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                body = encode(products, limit)
+                times.append(time.perf_counter() - start)
+            results[name] = {
+                "products": min(len(products), limit),
+                "bytes": len(body),
+                "median_ms": statistics.median(times) * 1000,
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    results = benchmark(limit=args.limit, repeat=args.repeat)
+    print(f"{'encoder':<22}{'products':>10}{'bytes':>10}{'median ms':>12}")
+    for name, result in results.items():
+        print(
+            f"{name:<22}{result['products']:>10}{result['bytes']:>10}"
+            f"{result['median_ms']:>12.2f}"
+        )
@@ -0,0 +1,69 @@
+"""
+Bulk writes
+
+The /bulk routes take a list of items, check the foreign keys and the
+existing rows of the whole list with one query each, and write the valid
+items with a single executemany in one transaction.  Every item gets a
+result, in the order of the request:
+
+    {"results": [{"index": 0, "status": "created", "detail": null},
+                 {"index": 1, "status": "error", "detail": "..."}],
+     "created": 1, "updated": 0, "unchanged": 0, "errors": 1}
+
+An item that fails a check is skipped and the others are still written.
+Without upsert an item that already exists is an error; with upsert it
+is updated.
+"""
+
+from typing import Hashable
+
+from sqlalchemy import Table
+from sqlalchemy.dialects.sqlite import Insert, insert
+
+from src.schemas import BulkItemResult, BulkResult
+
+MAX_BULK_SIZE = 500
+
+
+def upsert_statement(
+    table: Table, columns: list[str], index_elements: list[str]
+) -> Insert:
+    """
+    An insert of columns that updates the other columns of a row that
+    conflicts on index_elements, or leaves it when there are none
+    """
+    statement = insert(table)
+    update_columns = [name for name in columns if name not in index_elements]
+    if update_columns and "updated_at" in table.c:
+        # the inserted value is the default of the column, the current time
+        update_columns.append("updated_at")
+    if update_columns:
+        return statement.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={name: statement.excluded[name] for name in update_columns},
+        )
+    return statement.on_conflict_do_nothing(index_elements=index_elements)
+
+
+def duplicate_indexes(keys: list[Hashable]) -> set[int]:
+    """The indexes of the keys that already appear earlier in keys"""
+    seen = set()
+    duplicates = set()
+    for index, key in enumerate(keys):
+        if key in seen:
+            duplicates.add(index)
+        seen.add(key)
+    return duplicates
+
+
+def bulk_result(results: list[BulkItemResult]) -> BulkResult:
+    counts = {"created": 0, "updated": 0, "unchanged": 0, "error": 0}
+    for result in results:
+        counts[result.status] += 1
+    return BulkResult(
+        results=results,
+        created=counts["created"],
+        updated=counts["updated"],
+        unchanged=counts["unchanged"],
+        errors=counts["error"],
+    )
@@ -0,0 +1,96 @@
+"""
+The whole ranked catalog tree, kept in memory as serialized bytes
+
+    [{department, "aisles": [{aisle, "products": [product, ...]}, ...]}, ...]
+
+is the same tree as GET /departments/{id}?with_aisles_and_products=true
+for every department, in rank order.  It is built with one query per
+table the first time it is requested, serialized to JSON and gzipped
+once, and served as is until a write in a router calls
+catalog_cache.invalidate(), or another worker changes the catalog.
+"""
+
+import gzip
+from dataclasses import dataclass
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload
+
+from src.catalog_version import catalog_version
+from src.models import Aisle, Department, ProductBase
+from src.schemas import AisleSchema, DepartmentSchema, ProductSchema
+
+
+@dataclass(frozen=True)
+class CatalogBytes:
+    body: bytes
+    gzip_body: bytes
+
+
+async def build_catalog(db: AsyncSession) -> list[dict]:
+    departments = (
+        await db.scalars(
+            select(Department).options(noload("*")).order_by(Department.rank)
+        )
+    ).all()
+    aisles = (
+        await db.scalars(
+            select(Aisle).options(noload("*")).order_by(Aisle.department_id, Aisle.rank)
+        )
+    ).all()
+    products = (
+        await db.scalars(
+            select(ProductBase).order_by(ProductBase.aisle_id, ProductBase.rank)
+        )
+    ).all()
+
+    products_by_aisle: dict[int, list[dict]] = {}
+    for product in products:
+        products_by_aisle.setdefault(product.aisle_id, []).append(
+            ProductSchema.model_validate(product).model_dump()
+        )
+    aisles_by_department: dict[int, list[dict]] = {}
+    for aisle in aisles:
+        aisle_dict = AisleSchema.model_validate(aisle).model_dump()
+        aisle_dict["products"] = products_by_aisle.get(aisle.aisle_id, [])
+        aisles_by_department.setdefault(aisle.department_id, []).append(aisle_dict)
+    catalog = []
+    for department in departments:
+        department_dict = DepartmentSchema.model_validate(department).model_dump()
+        department_dict["aisles"] = aisles_by_department.get(
+            department.department_id, []
+        )
+        catalog.append(department_dict)
+    return catalog
+
+
+class CatalogCache:
+    def __init__(self):
+        self.entry: CatalogBytes | None = None
+        # incremented by every invalidate, so a catalog that was being built
+        # while a write committed is not kept
+        self.version = 0
+
+    def invalidate(self) -> None:
+        self.version += 1
+        self.entry = None
+
+    async def get(self, db: AsyncSession) -> CatalogBytes:
+        await catalog_version.check(db)
+        entry = self.entry
+        if entry is not None:
+            return entry
+        version = self.version
+        catalog = await build_catalog(db)
+        body = orjson.dumps(catalog)
+        # mtime=0 so the same catalog always compresses to the same bytes
+        entry = CatalogBytes(body, gzip.compress(body, compresslevel=9, mtime=0))
+        if version == self.version:
+            self.entry = entry
+        return entry
+
+
+catalog_cache = CatalogCache()
+catalog_version.on_change(catalog_cache.invalidate)
@@ -0,0 +1,124 @@
+"""
+Cache coherence between workers
+
+The catalog, response and other in-memory caches belong to one worker,
+but any worker can handle a write.  Every session that writes also
+increments the single catalog_version row in the same transaction, so
+the version in the database changes exactly when the data does.
+
+Before a cache is used, the worker reads the version (a primary key
+lookup in the read transaction that the cached data comes from).  When
+another worker has changed it, the caches registered with
+catalog_version.on_change are cleared.  The writes of this worker
+invalidate its caches by tag instead, so they only record the version.
+"""
+
+from typing import Callable
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.models import CatalogVersion
+
+CATALOG_VERSION_ID = 1
+
+
+def bump_catalog_version(connection: Connection) -> int:
+    """Increment the version in the transaction of connection, returns it"""
+    table = CatalogVersion.__table__
+    return connection.execute(
+        insert(table)
+        .values(id=CATALOG_VERSION_ID, version=1)
+        .on_conflict_do_update(
+            index_elements=[table.c.id], set_={"version": table.c.version + 1}
+        )
+        .returning(table.c.version)
+    ).scalar_one()
+
+
+class CatalogVersionTracker:
+    def __init__(self):
+        self.version = 0
+        self.listeners: list[Callable[[], None]] = []
+
+    def on_change(self, listener: Callable[[], None]) -> None:
+        self.listeners.append(listener)
+
+    async def check(self, db: AsyncSession) -> int:
+        """
+        Clear the caches if another worker changed the catalog, and return
+        the version db reads.
+
+        Any difference counts as a change, so a database that was rebuilt
+        also clears them.  If db reads an older snapshot than a concurrent
+        request, what it caches is cleared again by the next check.
+
+        The version is read once per session, a request that uses several
+        caches (or an ETag) makes a single query.
+        """
+        if "catalog_version_read" in db.info:
+            return db.info["catalog_version_read"]
+        version = (
+            await db.scalar(
+                select(CatalogVersion.version).filter(
+                    CatalogVersion.id == CATALOG_VERSION_ID
+                )
+            )
+            or 0
+        )
+        db.info["catalog_version_read"] = version
+        if version != self.version:
+            self.version = version
+            for listener in self.listeners:
+                listener()
+        return version
+
+    def committed(self, version: int) -> None:
+        """
+        A write of this worker committed version.  If it directly follows
+        the version already seen, no other worker wrote in between.
+        """
+        if version == self.version + 1:
+            self.version = version
+
+
+catalog_version = CatalogVersionTracker()
+
+
+@event.listens_for(Session, "after_flush")
+def record_flush(session: Session, flush_context) -> None:
+    session.info["catalog_changed"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def record_bulk_write(orm_execute_state) -> None:
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        orm_execute_state.session.info["catalog_changed"] = True
+
+
+@event.listens_for(Session, "before_commit")
+def bump_on_write(session: Session) -> None:
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    if session.info.pop("catalog_changed", False):
+        session.info["catalog_version"] = bump_catalog_version(session.connection())
+
+
+@event.listens_for(Session, "after_commit")
+def record_commit(session: Session) -> None:
+    version = session.info.pop("catalog_version", None)
+    if version is not None:
+        catalog_version.committed(version)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_writes(session: Session) -> None:
+    session.info.pop("catalog_changed", None)
+    session.info.pop("catalog_version", None)
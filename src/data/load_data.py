@@ -1,8 +1,12 @@
 import json
 import os
 import re
+import time
+from typing import Iterator
 
 from box import Box
+from sqlalchemy import Engine, Table, bindparam, select, update
+from sqlalchemy.engine import Connection
 
 """
 https://pypi.org/project/python-box/
@@ -12,7 +16,19 @@ attribute or key value.
 """
 # from src.database import Session
 from src.database import SessionLocal as Session
-from src.models import Aisle, Department, Product, Section, SectionType
+from src.bulk import upsert_statement
+from src.catalog_version import bump_catalog_version
+from src.database import engine
+from src.data.stream_json import JSONStreamReader
+from src.search import suspended_search_index
+from src.models import (
+    Aisle,
+    Department,
+    Product,
+    Section,
+    SectionType,
+    parse_price_cents,
+)
 
 root_path = os.path.dirname(__file__)
 
@@ -258,3 +274,386 @@ def insert_section_by_index(index: int) -> None:
     keys = list(products.keys())
     product = products[keys[index]]
     insert_sections(product=product)
+
+
+"""
+Bulk load
+
+The insert_* functions above open a session and commit for every row.
+bulk_load_all loads the whole catalog with executemany in a single
+transaction, so there is one fsync instead of one per row.  Rows that
+already exist are updated (INSERT ... ON CONFLICT DO UPDATE), so it can
+be run again after the scraped data changes.
+"""
+
+BATCH_SIZE = 500
+
+
+def department_row(department: Box, rank: int) -> dict:
+    return {
+        "department_id": int(department.id),
+        "name": department.name,
+        "rank": rank,
+    }
+
+
+def aisle_row(aisle: Box, department_id: int, rank: int) -> dict:
+    return {
+        "aisle_id": int(aisle.id),
+        "name": aisle.name,
+        "department_id": int(department_id),
+        "rank": rank,
+    }
+
+
+def product_row(product: Box, aisle_id: int, rank: int) -> dict:
+    return {
+        "product_id": int(product.product_id),
+        "name": product.name,
+        "rank": rank,
+        "size": product.size,
+        "src": product.src,
+        "price": product.price,
+        "price_cents": parse_price_cents(product.price),
+        "affix": product.affix,
+        "aisle_id": int(aisle_id),
+    }
+
+
+def product_details_row(product_details: Box) -> dict:
+    # see update_product_details: price_per is the price in the details
+    return {
+        "alt": product_details.alt,
+        "price_per": product_details.price,
+        "price_per_cents": parse_price_cents(product_details.price),
+    }
+
+
+def get_department_rows() -> list[dict]:
+    return [
+        department_row(department, department.rank)
+        for department in get_departments_with_rank()
+    ]
+
+
+def get_aisle_rows() -> list[dict]:
+    return [
+        aisle_row(aisle, aisle.department_id, aisle.rank)
+        for aisle in get_aisles_with_rank().values()
+    ]
+
+
+def get_product_rows(products_details: Box | None) -> list[dict]:
+    rows = []
+    for product in get_products_with_rank().values():
+        row = product_row(product, product.aisle_id, product.rank)
+        # like update_all_product_details, a product without details keeps
+        # the alt and price_per it has
+        product_details = (products_details or {}).get(str(product.product_id))
+        if product_details is not None:
+            row.update(product_details_row(product_details))
+        rows.append(row)
+    return rows
+
+
+def get_section_rows(products_details: Box, product_ids: set[int]) -> list[dict]:
+    rows = []
+    for product in products_details.values():
+        rows.extend(section_rows(product, product_ids))
+    return rows
+
+
+def section_rows(product: Box, product_ids: set[int]) -> list[dict]:
+    """
+    Sections with an invalid name, or whose parent or child product is not
+    in product_ids, are skipped: they would fail the foreign key checks
+    and abort the whole transaction.
+    """
+    section_names = {member.value for member in SectionType}
+    parent_product_id = int(product.product_id)
+    if parent_product_id not in product_ids:
+        return []
+    rows = []
+    for section in product.sections:
+        if section.name not in section_names or not section.products:
+            continue
+        for section_product in section.products:
+            if not section_product.product_id:
+                continue
+            child_product_id = int(section_product.product_id)
+            if child_product_id not in product_ids:
+                continue
+            rows.append(
+                {
+                    "section_type": SectionType(section.name),
+                    "parent_product_id": parent_product_id,
+                    "child_product_id": child_product_id,
+                }
+            )
+    return rows
+
+
+def upsert_rows(
+    connection: Connection,
+    table: Table,
+    rows: list[dict],
+    index_elements: list[str],
+) -> int:
+    """
+    Insert the rows with executemany in batches of BATCH_SIZE, updating the
+    other columns of rows that conflict on index_elements.  Rows with
+    different columns are sent with a statement each, so a column missing
+    from a row is left as it is.
+    """
+    rows_by_columns: dict[tuple[str, ...], list[dict]] = {}
+    for row in rows:
+        rows_by_columns.setdefault(tuple(row), []).append(row)
+    for columns, column_rows in rows_by_columns.items():
+        statement = upsert_statement(table, list(columns), index_elements)
+        for start in range(0, len(column_rows), BATCH_SIZE):
+            connection.execute(statement, column_rows[start : start + BATCH_SIZE])
+    return len(rows)
+
+
+def get_products_details_if_exists() -> Box | None:
+    if not os.path.exists(os.path.join(root_path, "products_details.json")):
+        print("products_details.json not found, skipping product details")
+        return None
+    return get_products_details()
+
+
+def report(name: str, count: int, seconds: float) -> None:
+    rate = count / seconds if seconds else 0
+    print(f"{name}: {count} rows in {seconds:.3f}s ({rate:.0f} rows/sec)")
+
+
+def bulk_load_all(bind: Engine = engine) -> dict[str, int]:
+    """
+    Load departments, aisles, products and sections (when
+    products_details.json exists) in one transaction.
+
+    Returns the number of rows loaded for each table.
+    """
+    products_details = get_products_details_if_exists()
+    counts = {}
+    start = time.perf_counter()
+    with bind.begin() as connection, suspended_search_index(connection):
+        # running workers clear their caches once this transaction commits
+        bump_catalog_version(connection)
+        for name, table, get_rows, index_elements in [
+            (
+                "departments",
+                Department.__table__,
+                get_department_rows,
+                ["department_id"],
+            ),
+            ("aisles", Aisle.__table__, get_aisle_rows, ["aisle_id"]),
+            (
+                "products",
+                Product.__table__,
+                lambda: get_product_rows(products_details),
+                ["product_id"],
+            ),
+        ]:
+            table_start = time.perf_counter()
+            counts[name] = upsert_rows(connection, table, get_rows(), index_elements)
+            report(name, counts[name], time.perf_counter() - table_start)
+
+        if products_details is not None:
+            table_start = time.perf_counter()
+            product_ids = set(
+                connection.execute(select(Product.__table__.c.product_id)).scalars()
+            )
+            rows = get_section_rows(products_details, product_ids)
+            counts["sections"] = upsert_rows(
+                connection,
+                Section.__table__,
+                rows,
+                ["section_type", "parent_product_id", "child_product_id"],
+            )
+            report("sections", counts["sections"], time.perf_counter() - table_start)
+    report("total", sum(counts.values()), time.perf_counter() - start)
+    return counts
+
+
+"""
+Streaming load
+
+get_costco and get_products_details read a whole file into a string,
+parse it and copy it into a Box, so the loader holds the data three
+times.  stream_load_all walks the files with JSONStreamReader instead:
+one aisle is decoded at a time, and only the rows of the current
+department are held until its "order" (which follows the aisles in
+costco.json) gives the aisle ranks.
+"""
+
+
+def read_department_order(file_name: str) -> list[int]:
+    with open(file_name) as file:
+        reader = JSONStreamReader(file)
+        for key in reader.items():
+            if key == "order":
+                return reader.value()
+    return []
+
+
+def iter_department_rows(
+    reader: JSONStreamReader, rank: int
+) -> Iterator[tuple[str, dict]]:
+    """
+    Yield ("departments", row), then the ("aisles", row) and
+    ("products", row) of the department at the reader position.
+
+    Like get_aisles_with_rank and get_products_with_rank, only the aisles
+    and products listed in an "order" are loaded.
+    """
+    department = Box()
+    aisles = {}
+    aisle_order = []
+    for key in reader.items():
+        if key == "aisles":
+            for aisle_id in reader.items():
+                aisle = Box(reader.value())
+                products = aisle.get("products", {})
+                product_rows = [
+                    product_row(products[str(product_id)], aisle.id, product_rank)
+                    for product_rank, product_id in enumerate(aisle.order)
+                    if str(product_id) in products
+                ]
+                aisles[str(aisle_id)] = (
+                    Box(id=aisle.id, name=aisle.name),
+                    product_rows,
+                )
+        elif key == "order":
+            aisle_order = reader.value()
+        elif key in ("id", "name"):
+            department[key] = reader.value()
+
+    ranked_aisles = [
+        aisles[str(aisle_id)] for aisle_id in aisle_order if str(aisle_id) in aisles
+    ]
+    yield "departments", department_row(department, rank)
+    for aisle_rank, (aisle, _) in enumerate(ranked_aisles):
+        yield "aisles", aisle_row(aisle, department.id, aisle_rank)
+    for _, product_rows in ranked_aisles:
+        for row in product_rows:
+            yield "products", row
+
+
+def iter_catalog_rows(file_name: str) -> Iterator[tuple[str, dict]]:
+    """Yield (table name, row) for costco.json, parents before children"""
+    department_ranks = {
+        str(department_id): rank
+        for rank, department_id in enumerate(read_department_order(file_name))
+    }
+    with open(file_name) as file:
+        reader = JSONStreamReader(file)
+        for key in reader.items():
+            if key != "departments":
+                continue
+            for department_id in reader.items():
+                if department_id in department_ranks:
+                    yield from iter_department_rows(
+                        reader, department_ranks[department_id]
+                    )
+
+
+def iter_products_details(file_name: str) -> Iterator[Box]:
+    with open(file_name) as file:
+        reader = JSONStreamReader(file)
+        for _ in reader.items():
+            yield Box(reader.value())
+
+
+def stream_products_details(connection: Connection, file_name: str) -> dict[str, int]:
+    """
+    Update the alt and price_per of the products in file_name, and upsert
+    their sections, in batches of BATCH_SIZE while the file is read.
+
+    Returns the number of rows loaded for product_details and sections.
+    """
+    start = time.perf_counter()
+    products = Product.__table__
+    update_details = update(products).where(
+        products.c.product_id == bindparam("row_product_id")
+    )
+    section_key = ["section_type", "parent_product_id", "child_product_id"]
+    product_ids = set(connection.execute(select(products.c.product_id)).scalars())
+    counts = {"product_details": 0, "sections": 0}
+    details_batch = []
+    sections_batch = []
+
+    def flush() -> None:
+        if details_batch:
+            connection.execute(update_details, details_batch)
+        counts["product_details"] += len(details_batch)
+        counts["sections"] += upsert_rows(
+            connection, Section.__table__, sections_batch, section_key
+        )
+        details_batch.clear()
+        sections_batch.clear()
+
+    for product_details in iter_products_details(file_name):
+        product_id = int(product_details.product_id)
+        if product_id in product_ids:
+            details_batch.append(
+                {"row_product_id": product_id, **product_details_row(product_details)}
+            )
+        sections_batch.extend(section_rows(product_details, product_ids))
+        if len(details_batch) + len(sections_batch) >= BATCH_SIZE:
+            flush()
+    flush()
+    for name, count in counts.items():
+        print(f"{name}: {count} rows")
+    report("details", sum(counts.values()), time.perf_counter() - start)
+    return counts
+
+
+def stream_load_all(
+    bind: Engine = engine,
+    costco_file: str = os.path.join(root_path, "costco.json"),
+    products_details_file: str = os.path.join(root_path, "products_details.json"),
+) -> dict[str, int]:
+    """
+    Same result as bulk_load_all, in one transaction, with the rows sent
+    in batches of BATCH_SIZE while the files are read.
+
+    Returns the number of rows loaded for each table.
+    """
+    tables = {
+        "departments": (Department.__table__, ["department_id"]),
+        "aisles": (Aisle.__table__, ["aisle_id"]),
+        "products": (Product.__table__, ["product_id"]),
+    }
+    # a product listed in several aisles is sent once per aisle, the last
+    # one kept as in get_products_with_rank, so the keys are counted
+    keys = {name: set() for name in tables}
+    batches = {name: [] for name in tables}
+    start = time.perf_counter()
+    with bind.begin() as connection, suspended_search_index(connection):
+        # running workers clear their caches once this transaction commits
+        bump_catalog_version(connection)
+
+        def flush_catalog() -> None:
+            # parents before children, for the foreign keys
+            for name, (table, index_elements) in tables.items():
+                upsert_rows(connection, table, batches[name], index_elements)
+                batches[name].clear()
+
+        for name, row in iter_catalog_rows(costco_file):
+            batches[name].append(row)
+            keys[name].add(row[tables[name][1][0]])
+            if len(batches[name]) >= BATCH_SIZE:
+                flush_catalog()
+        flush_catalog()
+        counts = {name: len(keys[name]) for name in tables}
+        for name, count in counts.items():
+            print(f"{name}: {count} rows")
+        report("catalog", sum(counts.values()), time.perf_counter() - start)
+
+        if os.path.exists(products_details_file):
+            counts.update(stream_products_details(connection, products_details_file))
+        else:
+            print(f"{products_details_file} not found, skipping product details")
+    report("total", sum(counts.values()), time.perf_counter() - start)
+    return counts
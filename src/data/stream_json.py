@@ -0,0 +1,151 @@
+"""
+Incremental JSON reader
+
+Walks a JSON document read from a file in chunks, so only the value
+currently being decoded is held in memory instead of the whole file.
+
+    with open(file_name) as file:
+        reader = JSONStreamReader(file)
+        for key in reader.items():        # members of the top level object
+            if key == "departments":
+                for department_id in reader.items():
+                    department = reader.value()
+            else:
+                reader.skip()
+
+After each key yielded by items(), the value is read with value(),
+skip() or a nested items().  A value that is not read is skipped.
+"""
+
+import json
+from typing import Any, Iterator, TextIO
+
+WHITESPACE = " \t\n\r"
+NUMBER_START = "-0123456789"
+NUMBER_CHARS = "-+.eE0123456789"
+
+
+class JSONStreamReader:
+    def __init__(self, file: TextIO, chunk_size: int = 65536):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.pending = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size: int = 0) -> bool:
+        """
+        Drop the consumed text and read at least another chunk.
+        Returns False at the end of the file.
+        """
+        if self.eof:
+            return False
+        chunk = self.file.read(max(self.chunk_size, size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character, "" at the end"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r}, found {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Decode the value at the current position"""
+        self.pending = False
+        char = self._peek()
+        if char and char in NUMBER_START:
+            self._buffer_number()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # the value continues in the next chunk, double the buffer
+                # so a large value is decoded in O(log n) attempts
+                if self._fill(len(self.buffer)):
+                    continue
+                raise
+            self.pos = end
+            return value
+
+    def _buffer_number(self) -> None:
+        """
+        A number can be cut anywhere by the end of a chunk (e.g. "-1." or
+        "12"), read until the character after it is in the buffer
+        """
+        index = self.pos
+        while True:
+            while index < len(self.buffer) and self.buffer[index] in NUMBER_CHARS:
+                index += 1
+            if index < len(self.buffer):
+                return
+            index -= self.pos
+            if not self._fill():
+                return
+
+    def skip(self) -> None:
+        """Move past the value at the current position without decoding it"""
+        self.pending = False
+        if self._peek() not in "{[":
+            self.value()
+            return
+        depth = 0
+        in_string = False
+        escape = False
+        while True:
+            buffer = self.buffer
+            for index in range(self.pos, len(buffer)):
+                char = buffer[index]
+                if in_string:
+                    if escape:
+                        escape = False
+                    elif char == "\\":
+                        escape = True
+                    elif char == '"':
+                        in_string = False
+                elif char == '"':
+                    in_string = True
+                elif char in "{[":
+                    depth += 1
+                elif char in "}]":
+                    depth -= 1
+                    if depth == 0:
+                        self.pos = index + 1
+                        return
+            self.pos = len(buffer)
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON document")
+
+    def items(self) -> Iterator[str]:
+        """Yield the keys of the object at the current position"""
+        self.pending = False
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(":")
+            self.pending = True
+            yield key
+            if self.pending:
+                self.skip()
+            if self._expect(",}") == "}":
+                return
@@ -1,35 +1,148 @@
-from typing import Generator
+import os
+from typing import AsyncGenerator
 from sqlalchemy import create_engine
 from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.orm.session import Session
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Connection, Engine
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./costco.db"
-ECHO = True
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./costco.db"
+READ_ONLY_DATABASE_URL = "sqlite+aiosqlite:///file:./costco.db?mode=ro&uri=true"
+READ_POOL_SIZE = int(os.environ.get("READ_POOL_SIZE", 5))
+# log every SQL statement, for debugging only
+# per-request query timing is in src/instrumentation.py
+ECHO = os.environ.get("SQLALCHEMY_ECHO", "false").lower() in ("1", "true")
 
+"""
+SQLite pragmas applied to every new connection.
+
+"safe" only turns on the foreign key checks the models depend on.
+"performance" uses a write-ahead log so readers are not blocked by a
+writer, relaxes fsync to the end of each WAL checkpoint, memory maps the
+database file and waits on a lock instead of failing with
+"database is locked".
+
+Select the profile with SQLITE_PROFILE and override a single pragma with
+SQLITE_<PRAGMA>, e.g. SQLITE_PROFILE=performance SQLITE_MMAP_SIZE=0
+"""
+SQLITE_PROFILES = {
+    "safe": {
+        "foreign_keys": "ON",
+    },
+    "performance": {
+        "foreign_keys": "ON",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,  # 256 MB
+        "cache_size": -64000,  # negative is in KiB, so 64 MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,  # milliseconds
+    },
+}
+
+
+def get_sqlite_pragmas() -> dict[str, str | int]:
+    profile = os.environ.get("SQLITE_PROFILE", "performance")
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(
+            f"Unknown SQLITE_PROFILE {profile}.  Expected one of {list(SQLITE_PROFILES)}"
+        )
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for name in pragmas:
+        value = os.environ.get(f"SQLITE_{name.upper()}")
+        if value is not None:
+            pragmas[name] = value
+    return pragmas
+
+
+SQLITE_PRAGMAS = get_sqlite_pragmas()
+
+"""
+The synchronous engine is used by the data loaders (src/data/load_data.py)
+and for creating the tables.  The routers use the async engines so that a
+slow query does not block the event loop:
+- read_engine: a pool of read-only connections for the GET routes
+- write_engine: a single connection, so writes are serialized in the pool
+  instead of contending for the SQLite write lock
+"""
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, echo=ECHO
 )
 
+read_engine = create_async_engine(
+    READ_ONLY_DATABASE_URL,
+    pool_size=READ_POOL_SIZE,
+    max_overflow=0,
+    echo=ECHO,
+)
+
+write_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL, pool_size=1, max_overflow=0, echo=ECHO
+)
+
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Session = sessionmaker(bind=engine, autocommit=False)
 
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine, autoflush=False, expire_on_commit=False
+)
+
+WriteSessionLocal = async_sessionmaker(
+    bind=write_engine, autoflush=False, expire_on_commit=False
+)
+
 
 @event.listens_for(Engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
     cursor.close()
 
 
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
-    try:
+def set_query_only(dbapi_connection, connection_record):
+    """
+    mode=ro already rejects writes at the file level, query_only also
+    rejects them if the connection is ever opened without the URI
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+event.listen(read_engine.sync_engine, "connect", set_query_only)
+
+
+def read_sqlite_pragmas(connection: Connection) -> dict[str, str | int]:
+    """
+    Return the value SQLite reports for each configured pragma,
+    which can differ from the requested one (e.g. journal_mode of an
+    in-memory database)
+    """
+    return {
+        name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        for name in SQLITE_PRAGMAS
+    }
+
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    async with ReadSessionLocal() as db:
+        yield db
+
+
+def get_read_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    """
+    For a response that reads after the route returns, like a
+    StreamingResponse, and opens its own session
+    """
+    return ReadSessionLocal
+
+
+async def get_write_db() -> AsyncGenerator[AsyncSession, None]:
+    async with WriteSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 Base = declarative_base()
@@ -0,0 +1,118 @@
+"""
+Sparse fieldsets
+
+The product, aisle and department reads take fields=product_id,name,price
+to return only those fields.  The query then selects only the columns of
+the requested fields instead of ORM objects, and every row is returned
+as a dict of the requested fields: fewer columns are read, no objects
+are built, and the responses are smaller.
+
+The key of the entity (e.g. product_id) is always included, so the
+response cache can tag the response with the entity.  The response is
+not tagged with the parents the fields leave out (the aisle and
+department of a product), so the deletes that cascade to the entity
+invalidate the tags of the deleted rows themselves.  A computed field
+(href) selects the columns it is computed from.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Sequence
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy import Result, Select, select
+from sqlalchemy.orm import raiseload
+from starlette import status
+
+from src.models import Aisle, Base, Department, Product
+from src.schemas import AisleSchema, DepartmentSchema, ProductSchema
+
+fields_query = Query(
+    default=None,
+    description="Comma separated fields to return, e.g. product_id,name,price",
+)
+
+
+@dataclass(frozen=True)
+class Fieldset:
+    model: type[Base]
+    schema: type[BaseModel]
+    key: str
+    # computed field -> the columns it is computed from
+    computed: dict[str, tuple[str, ...]] = field(default_factory=dict)
+
+    def parse(self, fields: str | None) -> list[str] | None:
+        """The requested fields with the key first, None for all of them"""
+        if fields is None:
+            return None
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in self.schema.model_fields]
+        if unknown or not names:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Unknown fields {', '.join(unknown)}.  Expected some of {', '.join(self.schema.model_fields)}",
+            )
+        return list(dict.fromkeys([self.key, *names]))
+
+    def query(self, fields: list[str] | None, *extra_columns) -> Select:
+        """The model without its relationships for all the fields"""
+        if fields is None:
+            return select(self.model).options(raiseload("*"))
+        return self.select(fields, *extra_columns)
+
+    def select(self, fields: list[str], *extra_columns) -> Select:
+        """
+        The columns of fields, and extra_columns (e.g. a sort key that is
+        not in fields)
+        """
+        table_columns = self.model.__table__.c
+        columns = {}
+        for name in fields:
+            for column_name in self.computed.get(name, (name,)):
+                columns[column_name] = table_columns[column_name]
+        for column in extra_columns:
+            columns.setdefault(column.key, table_columns[column.key])
+        return select(*columns.values())
+
+    def rows(self, result: Result, fields: list[str] | None) -> Sequence:
+        """ORM objects for all the fields, otherwise rows of the columns"""
+        if fields is None:
+            return result.scalars().all()
+        return result.all()
+
+    def serialize(
+        self, rows: Sequence, fields: list[str] | None
+    ) -> list[BaseModel] | list[dict[str, Any]]:
+        if fields is None:
+            return [self.schema.model_validate(row) for row in rows]
+        return [self.to_dict(row, fields) for row in rows]
+
+    def to_dict(self, row, fields: list[str]) -> dict[str, Any]:
+        return {
+            name: (
+                # the property of the model, with the row in place of self
+                getattr(self.model, name).func(row)
+                if name in self.computed
+                else getattr(row, name)
+            )
+            for name in fields
+        }
+
+
+PRODUCT_FIELDS = Fieldset(
+    Product, ProductSchema, "product_id", {"href": ("product_id",)}
+)
+AISLE_FIELDS = Fieldset(
+    Aisle, AisleSchema, "aisle_id", {"href": ("aisle_id", "department_id")}
+)
+DEPARTMENT_FIELDS = Fieldset(
+    Department, DepartmentSchema, "department_id", {"href": ("department_id",)}
+)
+
+
+def ensure_no_fields(fields: list[str] | None, option: str) -> None:
+    if fields is not None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"fields cannot be combined with {option}",
+        )
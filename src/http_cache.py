@@ -0,0 +1,64 @@
+"""
+ETags and conditional GET
+
+The read routes answer with a strong ETag derived from the catalog
+version, which every write increments in its transaction (see
+src/catalog_version.py), so the same URL has the same body for as long
+as the version does not change:
+
+    ETag: "v42"
+
+A request with a matching If-None-Match gets 304 Not Modified after the
+version is read (one primary key lookup), before the route queries or
+serializes anything.
+
+The version is global, so any write changes the ETag of every response.
+Cache-Control lets a browser or a CDN keep responses for
+HTTP_CACHE_MAX_AGE seconds, then revalidate them with If-None-Match.
+"""
+
+import os
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from src.catalog_version import catalog_version
+from src.database import get_read_db
+
+HTTP_CACHE_MAX_AGE = int(os.environ.get("HTTP_CACHE_MAX_AGE", 0))
+CACHE_CONTROL = f"public, max-age={HTTP_CACHE_MAX_AGE}, must-revalidate"
+
+
+def catalog_etag(version: int) -> str:
+    return f'"v{version}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses the weak comparison, so W/ is ignored"""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+async def conditional_get(
+    request: Request,
+    response: Response,
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+) -> None:
+    """
+    Router dependency: set the ETag and Cache-Control of a GET response,
+    or answer 304 when the client already has it.  Other methods are
+    left alone.  db is the read session of the route, FastAPI reuses it.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return
+    etag = catalog_etag(await catalog_version.check(db))
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
@@ -0,0 +1,76 @@
+"""
+Per-request SQL instrumentation
+
+Every statement executed through any engine is timed with the
+before/after_cursor_execute events.  The totals for the current request
+are returned in a Server-Timing header, e.g.
+
+    Server-Timing: db;dur=1.52;desc="3 queries", app;dur=4.87
+
+and statements slower than SLOW_QUERY_MS (default 100) are logged.
+"""
+
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+
+logger = logging.getLogger("uvicorn.error")
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    duration: float = 0.0  # seconds
+
+
+query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start_time"].pop()
+    stats = query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += duration
+    if duration * 1000 >= SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query (%.1f ms): %s %s", duration * 1000, statement, parameters
+        )
+
+
+async def server_timing_middleware(request: Request, call_next) -> Response:
+    stats = QueryStats()
+    token = query_stats.set(stats)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        query_stats.reset(token)
+    duration = time.perf_counter() - start
+    response.headers["Server-Timing"] = (
+        f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries", '
+        f"app;dur={duration * 1000:.2f}"
+    )
+    logger.debug(
+        "%s %s: %d queries, db %.2f ms, total %.2f ms",
+        request.method,
+        request.url.path,
+        stats.count,
+        stats.duration * 1000,
+        duration * 1000,
+    )
+    return response
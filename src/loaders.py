@@ -7,8 +7,14 @@ In a Unix terminal window, cd to parent directory of the "src" directory.
 pipenv shell
 # run as a module
 python -m src.loaders
+# load the whole catalog in a single transaction
+python -m src.loaders --bulk
+# same, reading the data files incrementally
+python -m src.loaders --bulk --stream
 """
 
+import sys
+
 from src.database import engine
 from src.models import Base, Department, Aisle, Product, Section
 from src.data import load_data
@@ -45,6 +51,13 @@ def create_database():
 
 
 if __name__ == "__main__":
+    if "--bulk" in sys.argv:
+        create_database()
+        if "--stream" in sys.argv:
+            load_data.stream_load_all()
+        else:
+            load_data.bulk_load_all()
+        sys.exit()
     # create_database()
     print(load_data.get_departments_with_rank())
     # load_data.insert_all_departments()
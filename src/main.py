@@ -1,13 +1,39 @@
+import logging
+from dataclasses import asdict
+from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from src.models import Base
-from src.database import engine
+from src.database import engine, read_sqlite_pragmas
+from src.instrumentation import server_timing_middleware
+from src.migrations import upgrade_database
+from src.autocomplete import autocomplete_index
+from src.product_filters import listing_statements
+from src.section_graph import section_graph
+from src.response_cache import response_cache
 
-from .routers import products, aisles, departments, sections
+from .routers import products, aisles, departments, sections, catalog, export
 
-app = FastAPI()
+logger = logging.getLogger("uvicorn.error")
 
 Base.metadata.create_all(bind=engine)
+upgrade_database(engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with engine.connect() as connection:
+        settings = read_sqlite_pragmas(connection)
+    logger.info(
+        "SQLite settings: %s",
+        ", ".join(f"{name}={value}" for name, value in settings.items()),
+    )
+    yield
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.middleware("http")(server_timing_middleware)
 
 
 @app.get("/healthy")
@@ -15,11 +41,24 @@ def health_check():
     return {"status": "Healthy"}
 
 
+@app.get("/cache")
+def cache_stats():
+    return {
+        "entries": len(response_cache.entries),
+        **asdict(response_cache.stats),
+        "autocomplete": autocomplete_index.stats(),
+        "listing_statements": listing_statements.stats(),
+        "section_graph": section_graph.stats(),
+    }
+
+
 # app.include_router(auth.router)
 app.include_router(products.router)
 app.include_router(aisles.router)
 app.include_router(departments.router)
 app.include_router(sections.router)
+app.include_router(catalog.router)
+app.include_router(export.router)
 # app.include_router(admin.router)
 # app.include_router(users.router)
 
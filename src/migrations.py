@@ -0,0 +1,77 @@
+"""
+Bring an existing database up to date with the models.
+
+Base.metadata.create_all only creates missing tables, so columns and
+indexes added to an existing table (e.g. the committed costco.db), and
+the full text index of the products (src/search.py), are added here.
+Every step is idempotent, and runs at startup after create_all.
+"""
+
+from sqlalchemy import Engine, bindparam, inspect, select, update
+from sqlalchemy.engine import Connection
+
+from src.models import Base, ProductBase, Section, parse_price_cents, utcnow
+from src.search import create_search_index
+
+
+def add_missing_columns(connection: Connection) -> dict[str, list[str]]:
+    """Returns the names of the added columns for each table"""
+    inspector = inspect(connection)
+    added = {}
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            )
+            added.setdefault(table.name, []).append(column.name)
+    return added
+
+
+def create_missing_indexes(connection: Connection) -> None:
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def backfill_price_cents(connection: Connection) -> None:
+    products = ProductBase.__table__
+    rows = connection.execute(
+        select(products.c.id, products.c.price, products.c.price_per)
+    ).all()
+    values = [
+        {
+            "row_id": row.id,
+            "price_cents": parse_price_cents(row.price),
+            "price_per_cents": parse_price_cents(row.price_per),
+        }
+        for row in rows
+    ]
+    if values:
+        connection.execute(
+            update(products).where(products.c.id == bindparam("row_id")),
+            values,
+        )
+
+
+def backfill_updated_at(connection: Connection, added: dict[str, list[str]]) -> None:
+    """The existing rows count as updated when the column is added"""
+    now = utcnow()
+    for table in [ProductBase.__table__, Section.__table__]:
+        if "updated_at" in added.get(table.name, []):
+            connection.execute(update(table).values(updated_at=now))
+
+
+def upgrade_database(engine: Engine) -> None:
+    with engine.begin() as connection:
+        added = add_missing_columns(connection)
+        if "price_cents" in added.get("products", []):
+            backfill_price_cents(connection)
+        backfill_updated_at(connection, added)
+        create_missing_indexes(connection)
+        create_search_index(connection)
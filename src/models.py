@@ -1,4 +1,7 @@
 import enum
+import re
+from datetime import datetime, timezone
+from decimal import Decimal
 from functools import cached_property
 from pydantic import computed_field
 from sqlalchemy import (
@@ -7,14 +10,37 @@ from sqlalchemy import (
     String,
     ForeignKey,
     Enum,
+    Index,
 )
-from sqlalchemy.orm import Mapped, mapped_column, relationship, backref
+from sqlalchemy.orm import Mapped, mapped_column, relationship, backref, validates
 from sqlalchemy_serializer import SerializerMixin
 from box import BoxList
 from typing import Self
 
 from src.database import Base
 
+PRICE_PATTERN = re.compile(r"\d[\d,]*(?:\.\d+)?|\.\d+")
+
+
+def parse_price_cents(price: str | None) -> int | None:
+    """
+    Parse the scraped display price into integer cents
+       "$2.48" -> 248
+       "~$12.99 /item" -> 1299
+       "" -> None
+    """
+    if not price:
+        return None
+    match = PRICE_PATTERN.search(price)
+    if match is None:
+        return None
+    return int(Decimal(match[0].replace(",", "")) * 100)
+
+
+def utcnow() -> datetime:
+    """The current time in UTC, naive like the DateTime values SQLite returns"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 
 @enum.unique
 class SectionType(str, enum.Enum):
@@ -76,6 +102,11 @@ class Aisle(Base):
     # )
     products = relationship("Product", order_by="Product.rank", cascade="all, delete")
 
+    __table_args__ = (
+        # aisles of a department, in rank order
+        Index("ix_aisles_department_id_rank", "department_id", "rank"),
+    )
+
     def __repr__(self):
         return f"Aisle: {self.name}, aisle_id: {self.aisle_id}"
 
@@ -98,6 +129,15 @@ class ProductBase(Base):
     price: Mapped[str] = mapped_column(nullable=True)
     affix: Mapped[str] = mapped_column(nullable=True)
     price_per: Mapped[str] = mapped_column(nullable=True)
+    # numeric copies of price and price_per, set by the validators below,
+    # for sorting and filtering in SQL
+    price_cents: Mapped[int] = mapped_column(nullable=True)
+    price_per_cents: Mapped[int] = mapped_column(nullable=True)
+    # set on every insert and update, for exporting the changes since a
+    # time.  Deferred, so it is only read by the export.
+    updated_at: Mapped[datetime] = mapped_column(
+        nullable=True, default=utcnow, onupdate=utcnow, deferred=True
+    )
     aisle_id: Mapped[str] = mapped_column(
         "aisle_id",
         Integer(),
@@ -126,9 +166,27 @@ class ProductBase(Base):
     #     "-sections['related_items'].parent",
     # )
 
+    __table_args__ = (
+        # products of an aisle in rank order, and the key for paging products
+        Index("ix_products_aisle_id_rank", "aisle_id", "rank", "product_id"),
+        # (price_cents, product_id) is the key for paging products by price
+        Index("ix_products_price_cents", "price_cents", "product_id"),
+        Index("ix_products_updated_at", "updated_at"),
+    )
+
     def __repr__(self):
         return f"Product: {self.name}, product_id: {self.product_id}"
 
+    @validates("price")
+    def validate_price(self, key, price):
+        self.price_cents = parse_price_cents(price)
+        return price
+
+    @validates("price_per")
+    def validate_price_per(self, key, price_per):
+        self.price_per_cents = parse_price_cents(price_per)
+        return price_per
+
     @computed_field
     @cached_property
     def href(self):
@@ -177,7 +235,10 @@ class Product(ProductBase):
 
         Use "child" relationship in Section to hydrate the Product
 
-        Note: makes a separate query for every child
+        Note: makes a separate query for every child, and needs a
+        synchronous Session.  The routers use
+        src.section_loader.load_sections, which loads the sections of
+        many products with a single query.
         """
         return {
             "featured_products": [
@@ -191,22 +252,6 @@ class Product(ProductBase):
             ],
         }
 
-    def add_sections(self) -> None:
-        """
-        Cache the sections dictionary and remove the raw Section relationship
-        from the object
-        """
-        self.sections
-        self.remove_section_relationships()
-
-    def remove_section_relationships(self) -> None:
-        for member in SectionType:
-            name = member.name
-            if hasattr(self, name):
-                delattr(self, name)
-            if name in self.__dict__:
-                self.__dict__.pop(member.name)
-
 
 class Section(Base):
     __tablename__ = "sections"
@@ -235,6 +280,9 @@ class Section(Base):
         nullable=False,
         primary_key=True,
     )
+    updated_at: Mapped[datetime] = mapped_column(
+        nullable=True, default=utcnow, onupdate=utcnow, deferred=True
+    )
     parent = relationship(
         ProductBase,
         primaryjoin=Product.product_id == parent_product_id,
@@ -246,6 +294,25 @@ class Section(Base):
         cascade="all,delete",
     )
 
+    __table_args__ = (
+        # the primary key starts with section_type, so it cannot be used to
+        # look up the sections of a product.  Both indexes cover the table,
+        # and also serve the ON DELETE CASCADE of each foreign key.
+        Index(
+            "ix_sections_parent_product_id",
+            "parent_product_id",
+            "section_type",
+            "child_product_id",
+        ),
+        Index(
+            "ix_sections_child_product_id",
+            "child_product_id",
+            "section_type",
+            "parent_product_id",
+        ),
+        Index("ix_sections_updated_at", "updated_at"),
+    )
+
     # serialize_rules = (
     #     #
     #     # "-product.child",
@@ -259,3 +326,15 @@ class Section(Base):
     #     # "-products.often_bought_with",
     #     # "-products.related_items",
     # )
+
+
+class CatalogVersion(Base):
+    """
+    A single row, incremented in the transaction of every write, so all the
+    workers can tell whether their caches are stale (see src/catalog_version.py)
+    """
+
+    __tablename__ = "catalog_version"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column()
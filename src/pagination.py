@@ -0,0 +1,66 @@
+"""
+Keyset pagination
+
+A page is read with "WHERE (sort key) > (last key of previous page)"
+instead of an OFFSET, so every page costs the same no matter how deep
+the client pages.  The last key is returned to the client as an opaque
+cursor:
+
+    {"items": [...], "next": "WzY3NiwgMiwgOTQ2MjQzMTBd"}
+
+"next" is null on the last page.
+"""
+
+import base64
+import binascii
+import json
+from typing import Any, Sequence
+
+from fastapi import HTTPException
+from starlette import status
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(key: Sequence[Any]) -> str:
+    data = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: Sequence[type | tuple[type, ...]]) -> list[Any]:
+    """
+    The key in cursor, with one value of each of types (the types of the
+    sort key columns, e.g. (int, type(None)) for a nullable integer)
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, ValueError):
+        key = None
+    if (
+        not isinstance(key, list)
+        or len(key) != len(types)
+        or not all(
+            # bool is an int, but never a key
+            isinstance(value, expected) and not isinstance(value, bool)
+            for value, expected in zip(key, types)
+        )
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor."
+        )
+    return key
+
+
+def make_page(items: Sequence[Any], limit: int, key_of) -> dict:
+    """
+    items are the rows of a query with limit + 1, the extra row only tells
+    whether there is a next page
+    """
+    items = list(items)
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(key_of(items[-1]))
+    return {"items": items, "next": next_cursor}
@@ -0,0 +1,49 @@
+"""
+Single statement partial updates
+
+The PATCH routes build one UPDATE ... WHERE ... RETURNING from the fields
+in the request (model_dump(exclude_unset=True)), so a field is changed
+whenever it is sent, even to a falsy value, and nothing is read before
+or after the update.  No row returned means the row does not exist.
+
+SQLite checks the foreign keys of the updated row in the same statement.
+A violation rolls the update back and is answered with 422, a duplicate
+value of a unique column with 409.
+"""
+
+from typing import Any
+
+from fastapi import HTTPException
+from sqlalchemy import Row, Update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+
+def patch_values(values: dict[str, Any], entity: str) -> dict[str, Any]:
+    if not values:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Cannot update {entity}.  No fields to update",
+        )
+    return values
+
+
+async def execute_patch(db: AsyncSession, statement: Update, entity: str) -> Row:
+    try:
+        row = (await db.execute(statement)).first()
+    except IntegrityError as error:
+        await db.rollback()
+        message = str(error.orig)
+        if "FOREIGN KEY" in message:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Cannot update {entity}.  A related row does not exist, or still refers to it",
+            )
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Cannot update {entity}.  {message}",
+        )
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"{entity.capitalize()} not found.")
+    return row
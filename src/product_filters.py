@@ -0,0 +1,246 @@
+"""
+Filtering and sorting of the product listings
+
+/products/by_aisle/{aisle_id} and /products/by_department/{department_id}
+take filters and a sort order in the query string:
+
+    ?price_gte=5&price_lt=20&size=oz&affix=/each&sort=-price,name
+
+    price_lt, price_lte, price_gt, price_gte
+            the price in dollars, compared with the indexed price_cents
+            (min_price and max_price are price_gte and price_lte)
+    size    the size contains the text, ignoring case
+    affix   the affix is the text
+    sort    comma separated rank, price, name and product_id, each
+            descending with a leading "-".  Ties are broken by product_id.
+
+The products are always found with an index first, those of the aisle
+(ix_products_aisle_id_rank) or of the aisles of the department
+(ix_aisles_department_id_rank), and the other filters only check those
+rows, so size and affix need no index of their own.  The first time a
+statement is used its plan is read with EXPLAIN QUERY PLAN, and a plan
+that reads a whole table is answered with 422 instead of being run.
+
+The statement only depends on the shape of the request: the filters
+that are given, the sort and the fields.  The values are bound
+parameters, so a statement is built once per shape and kept in
+listing_statements, and SQLAlchemy compiles it once.
+"""
+
+import operator
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Literal
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy import ColumnElement, Connection, Select, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from src.fieldsets import PRODUCT_FIELDS
+from src.models import Aisle, Product
+
+LISTING_STATEMENTS_SIZE = 256
+
+# a SCAN step reads every row of the table, or of one of its indexes
+FULL_SCAN = re.compile(r"^SCAN \w+( USING (COVERING )?INDEX \w+)?$")
+
+ListingScope = Literal["aisle", "department"]
+
+
+class ProductFilters(BaseModel):
+    price_lt: float | None = Field(default=None, ge=0)
+    price_lte: float | None = Field(default=None, ge=0)
+    price_gt: float | None = Field(default=None, ge=0)
+    price_gte: float | None = Field(default=None, ge=0)
+    min_price: float | None = Field(
+        default=None, ge=0, description="Minimum price in dollars"
+    )
+    max_price: float | None = Field(
+        default=None, ge=0, description="Maximum price in dollars"
+    )
+    size: str | None = Field(default=None, min_length=1, description="Text in the size")
+    affix: str | None = Field(default=None)
+    sort: str = Field(
+        default="rank",
+        description="Comma separated rank, price, name, product_id, descending with -",
+    )
+
+    def given(self) -> dict[str, Any]:
+        """The filters in the request"""
+        return self.model_dump(exclude_none=True, exclude={"sort"})
+
+
+def dollars_to_cents(price: float) -> int:
+    return round(price * 100)
+
+
+def contains_pattern(text: str) -> str:
+    """A LIKE pattern with escape "\\" matching text anywhere"""
+    for character in ("\\", "%", "_"):
+        text = text.replace(character, f"\\{character}")
+    return f"%{text}%"
+
+
+@dataclass(frozen=True)
+class Filter:
+    condition: Callable[[Any], ColumnElement[bool]]
+    # the value of the bound parameter from the value in the request
+    parameter: Callable[[Any], Any] = lambda value: value
+
+
+def price_filter(compare) -> Filter:
+    return Filter(
+        lambda parameter: compare(Product.price_cents, parameter), dollars_to_cents
+    )
+
+
+FILTERS = {
+    "price_lt": price_filter(operator.lt),
+    "price_lte": price_filter(operator.le),
+    "price_gt": price_filter(operator.gt),
+    "price_gte": price_filter(operator.ge),
+    "min_price": price_filter(operator.ge),
+    "max_price": price_filter(operator.le),
+    "size": Filter(
+        lambda parameter: Product.size.like(parameter, escape="\\"), contains_pattern
+    ),
+    "affix": Filter(lambda parameter: Product.affix == parameter),
+}
+
+SORT_KEYS = ("rank", "price", "name", "product_id")
+
+
+def sort_columns(name: str, scope: ListingScope) -> list:
+    if name == "rank":
+        if scope == "department":
+            return [Aisle.rank, Product.rank]
+        return [Product.rank]
+    if name == "price":
+        return [Product.price_cents]
+    return [getattr(Product, name)]
+
+
+def parse_sort(sort: str) -> tuple[tuple[str, bool], ...]:
+    """(name, descending) of each sort key, ending with product_id"""
+    keys = {}
+    for item in sort.split(","):
+        item = item.strip()
+        name = item.removeprefix("-")
+        if name not in SORT_KEYS or name in keys:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Invalid sort {sort}.  Expected comma separated {', '.join(SORT_KEYS)}, each once, descending with a leading -",
+            )
+        keys[name] = item.startswith("-")
+    keys.setdefault("product_id", False)
+    return tuple(keys.items())
+
+
+@dataclass(frozen=True)
+class ListingShape:
+    scope: ListingScope
+    filters: tuple[str, ...]
+    sort: tuple[tuple[str, bool], ...]
+    fields: tuple[str, ...] | None
+
+
+def listing_shape(
+    scope: ListingScope, filters: ProductFilters, fields: list[str] | None
+) -> ListingShape:
+    return ListingShape(
+        scope,
+        tuple(sorted(filters.given())),
+        parse_sort(filters.sort),
+        None if fields is None else tuple(fields),
+    )
+
+
+def listing_parameters(scope_id: int, filters: ProductFilters) -> dict[str, Any]:
+    """The bound parameters of the statement of filters"""
+    parameters = {
+        name: FILTERS[name].parameter(value) for name, value in filters.given().items()
+    }
+    parameters["scope_id"] = scope_id
+    return parameters
+
+
+def listing_statement(shape: ListingShape) -> Select:
+    query = PRODUCT_FIELDS.query(None if shape.fields is None else list(shape.fields))
+    if shape.scope == "aisle":
+        query = query.filter(Product.aisle_id == bindparam("scope_id"))
+    else:
+        query = query.join(Aisle, Aisle.aisle_id == Product.aisle_id).filter(
+            Aisle.department_id == bindparam("scope_id")
+        )
+    for name in shape.filters:
+        query = query.filter(FILTERS[name].condition(bindparam(name)))
+    order_by = []
+    for name, descending in shape.sort:
+        for column in sort_columns(name, shape.scope):
+            order_by.append(column.desc() if descending else column)
+    return query.order_by(*order_by)
+
+
+def full_scan_steps(connection: Connection, statement: Select) -> list[str]:
+    """The steps of the query plan of statement that read a whole table"""
+    compiled = statement.compile(dialect=connection.dialect)
+    plan = connection.exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {compiled.string}",
+        # the plan does not depend on the values
+        (None,) * len(compiled.positiontup or ()),
+    )
+    return [row.detail for row in plan if FULL_SCAN.match(row.detail)]
+
+
+class ListingStatements:
+    """The statements of the listing shapes, least recently used evicted"""
+
+    def __init__(self, max_entries: int = LISTING_STATEMENTS_SIZE):
+        self.max_entries = max_entries
+        # the statement, and the full scans of its plan
+        self.statements: OrderedDict[ListingShape, tuple[Select, list[str]]] = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    async def get(self, db: AsyncSession, shape: ListingShape) -> Select:
+        entry = self.statements.get(shape)
+        if entry is None:
+            self.misses += 1
+            statement = listing_statement(shape)
+            full_scans = await db.run_sync(
+                lambda session: full_scan_steps(session.connection(), statement)
+            )
+            entry = self.statements[shape] = (statement, full_scans)
+            while len(self.statements) > self.max_entries:
+                self.statements.popitem(last=False)
+        else:
+            self.hits += 1
+            self.statements.move_to_end(shape)
+        statement, full_scans = entry
+        if full_scans:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"The filters would read every row ({'; '.join(full_scans)})",
+            )
+        return statement
+
+    def clear(self) -> None:
+        self.statements.clear()
+
+    def stats(self) -> dict:
+        return {
+            "statements": len(self.statements),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+        }
+
+
+listing_statements = ListingStatements()
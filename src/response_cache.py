@@ -0,0 +1,183 @@
+"""
+In-process cache of GET responses
+
+A read route decorated with @cached keeps its response (the response
+models it returns) in response_cache, keyed on the route and its
+arguments (the path and query parameters).  Entries are evicted least
+recently used beyond RESPONSE_CACHE_SIZE entries, and expire after
+RESPONSE_CACHE_TTL seconds.
+
+Every entry is tagged with the department, aisle and product ids in the
+response (e.g. "aisle:677", "product:112770135"), and with the tags given
+to @cached for its arguments.  The create, update and delete routes call
+response_cache.invalidate with the tags of the rows they change, and
+the whole cache is cleared when another worker changes the catalog.
+"""
+
+import functools
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Hashable, Iterable
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.catalog_version import catalog_version
+
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 1024))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 300))
+
+
+def department_tag(department_id: int) -> str:
+    return f"department:{department_id}"
+
+
+def aisle_tag(aisle_id: int) -> str:
+    return f"aisle:{aisle_id}"
+
+
+def product_tag(product_id: int) -> str:
+    return f"product:{product_id}"
+
+
+def entity_tags(data: Any) -> set[str]:
+    """
+    The tags of the products, aisles and departments in JSON compatible data.
+    A product is also tagged with its aisle, and an aisle with its
+    department, so deleting the parent invalidates them.
+    """
+    tags = set()
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, list):
+            stack.extend(value)
+        elif isinstance(value, dict):
+            if "product_id" in value:
+                tags.add(product_tag(value["product_id"]))
+            if "aisle_id" in value:
+                tags.add(aisle_tag(value["aisle_id"]))
+            if "department_id" in value:
+                tags.add(department_tag(value["department_id"]))
+            stack.extend(value.values())
+    return tags
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    tags: set[str]
+    expires: float
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+
+@dataclass
+class ResponseCache:
+    max_entries: int = RESPONSE_CACHE_SIZE
+    ttl: float = RESPONSE_CACHE_TTL
+    entries: OrderedDict[Hashable, CacheEntry] = field(default_factory=OrderedDict)
+    keys_by_tag: dict[str, set[Hashable]] = field(default_factory=dict)
+    stats: CacheStats = field(default_factory=CacheStats)
+    # incremented by every invalidation, so a response that was being
+    # built while a write committed is not stored
+    version: int = 0
+
+    def get(self, key: Hashable) -> CacheEntry | None:
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires <= time.monotonic():
+            self._remove(key)
+            self.stats.expirations += 1
+            entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str]) -> None:
+        if key in self.entries:
+            self._remove(key)
+        entry = CacheEntry(value, set(tags), time.monotonic() + self.ttl)
+        self.entries[key] = entry
+        for tag in entry.tags:
+            self.keys_by_tag.setdefault(tag, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+            self.stats.evictions += 1
+
+    def invalidate(self, tags: Iterable[str]) -> None:
+        self.version += 1
+        for tag in tags:
+            for key in self.keys_by_tag.pop(tag, set()):
+                if key in self.entries:
+                    self._remove(key)
+                    self.stats.invalidations += 1
+
+    def clear(self) -> None:
+        self.version += 1
+        self.stats.invalidations += len(self.entries)
+        self.entries.clear()
+        self.keys_by_tag.clear()
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self.entries.pop(key)
+        for tag in entry.tags:
+            keys = self.keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.keys_by_tag[tag]
+
+
+response_cache = ResponseCache()
+catalog_version.on_change(response_cache.clear)
+
+
+def cached(*tag_templates: str):
+    """
+    Cache the response of a read route.
+
+    tag_templates are formatted with the arguments of the route, e.g.
+    @cached("aisle:{aisle_id}") for the products of an aisle, so an empty
+    list is invalidated when a product is added to the aisle.  The route
+    must take the read session, which is used to check the catalog version.
+    """
+
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(**kwargs):
+            arguments = {}
+            for name, value in kwargs.items():
+                if isinstance(value, AsyncSession):
+                    db = value
+                else:
+                    arguments[name] = value
+            await catalog_version.check(db)
+            key = (endpoint.__module__, endpoint.__qualname__) + tuple(
+                sorted((name, repr(value)) for name, value in arguments.items())
+            )
+            entry = response_cache.get(key)
+            if entry is not None:
+                return entry.value
+            version = response_cache.version
+            value = await endpoint(**kwargs)
+            if version == response_cache.version:
+                tags = {template.format(**arguments) for template in tag_templates}
+                tags |= entity_tags(jsonable_encoder(value))
+                response_cache.set(key, value, tags)
+            return value
+
+        return wrapper
+
+    return decorator
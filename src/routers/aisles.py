@@ -1,10 +1,33 @@
 from typing import Annotated
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session, noload, joinedload
-from fastapi import APIRouter, Depends, HTTPException, Path
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload, selectinload
+from fastapi import APIRouter, Body, Depends, HTTPException, Path
 from starlette import status
-from src.models import Product, Aisle, Department
-from src.database import get_db
+from src.models import Aisle, Department, Product
+from src.bulk import MAX_BULK_SIZE, bulk_result, duplicate_indexes, upsert_statement
+from src.catalog import catalog_cache
+from src.fieldsets import AISLE_FIELDS, ensure_no_fields, fields_query
+from src.partial_update import execute_patch, patch_values
+from src.response_cache import (
+    aisle_tag,
+    cached,
+    department_tag,
+    product_tag,
+    response_cache,
+)
+from src.autocomplete import autocomplete_index
+from src.section_graph import section_graph
+from src.database import get_read_db, get_write_db
+from src.http_cache import conditional_get
+from src.schemas import (
+    AisleSchema,
+    AisleWithProducts,
+    BulkItemResult,
+    BulkResult,
+    SparseFields,
+)
 
 # from .auth import get_current_user
 
@@ -12,15 +35,12 @@ router = APIRouter(
     #
     prefix="/aisles",
     tags=["aisles"],
+    dependencies=[Depends(conditional_get)],
 )
 
 
-db_dependency = Annotated[Session, Depends(get_db)]
-
-
-def add_href(models: list[BaseModel]) -> None:
-    for model in models:
-        model.href
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
+write_db_dependency = Annotated[AsyncSession, Depends(get_write_db)]
 
 
 class AisleRequest(BaseModel):
@@ -30,80 +50,99 @@ class AisleRequest(BaseModel):
     department_id: int = Field()
 
 
-@router.get("/", status_code=status.HTTP_200_OK)
-async def read_aisles(db: db_dependency):
-    aisles = db.query(Aisle).all()
-    add_href(aisles)
-    return aisles
+class AislePatch(BaseModel):
+    """Only the fields in the request are updated"""
+
+    name: str = Field(default=None)
+    aisle_id: int = Field(default=None)
+    rank: int = Field(default=None)
+    department_id: int = Field(default=None)
 
 
-@router.get("/{aisle_id}", status_code=status.HTTP_200_OK)
+@router.get(
+    "/",
+    status_code=status.HTTP_200_OK,
+    response_model=list[AisleSchema] | list[SparseFields],
+)
+@cached("aisles")
+async def read_aisles(db: read_db_dependency, fields: str | None = fields_query):
+    field_names = AISLE_FIELDS.parse(fields)
+    aisles = AISLE_FIELDS.rows(
+        await db.execute(AISLE_FIELDS.query(field_names)), field_names
+    )
+    return AISLE_FIELDS.serialize(aisles, field_names)
+
+
+@router.get(
+    "/{aisle_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=AisleWithProducts | AisleSchema | SparseFields,
+)
+@cached("aisle:{aisle_id}")
 async def read_aisle(
-    db: db_dependency, aisle_id: int = Path(gt=0), with_products: bool = False
+    db: read_db_dependency,
+    aisle_id: int = Path(gt=0),
+    with_products: bool = False,
+    fields: str | None = fields_query,
 ):
+    field_names = AISLE_FIELDS.parse(fields)
     if with_products:
-        aisle_model = (
-            db.query(Aisle)
-            .options(noload(Aisle.department))
-            .options(joinedload(Aisle.products).noload(Product.featured_products))
-            .options(joinedload(Aisle.products).noload(Product.related_items))
-            .options(joinedload(Aisle.products).noload(Product.often_bought_with))
-            .filter(Aisle.aisle_id == aisle_id)
-            .first()
-        )
-        for product in aisle_model.products:
-            product.href
+        ensure_no_fields(field_names, "with_products")
+    if field_names is not None:
+        row = (
+            await db.execute(
+                AISLE_FIELDS.query(field_names).filter(Aisle.aisle_id == aisle_id)
+            )
+        ).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Aisle not found.")
+        return AISLE_FIELDS.to_dict(row, field_names)
+    if with_products:
+        schema = AisleWithProducts
+        options = (selectinload(Aisle.products).raiseload("*"), raiseload("*"))
     else:
-        aisle_model = (
-            db.query(Aisle)
-            .options(noload("*"))
-            .filter(Aisle.aisle_id == aisle_id)
-            .first()
-        )
-        if hasattr(aisle_model, "products"):
-            delattr(aisle_model, "products")
+        schema = AisleSchema
+        options = (raiseload("*"),)
+    aisle_model = await db.scalar(
+        select(Aisle).options(*options).filter(Aisle.aisle_id == aisle_id)
+    )
     if aisle_model is None:
         raise HTTPException(status_code=404, detail="Aisle not found.")
-    aisle_model.href
-    # TODO: remove join from load
-    delattr(aisle_model, "department")
-    if hasattr(aisle_model, "products"):
-        products: list[Product] = aisle_model.products
-        for product in products:
-            product.remove_section_relationships()
-    return aisle_model
-
-
-@router.get("/by_department/{department_id}", status_code=status.HTTP_200_OK)
-async def read_aisles_by_department(db: db_dependency, department_id: int = Path(gt=0)):
-    aisles = (
-        db.query(Aisle)
-        .options(noload("*"))
-        .filter(Aisle.department_id == department_id)
-        .all()
-    )
+    return schema.model_validate(aisle_model)
+
+
+@router.get(
+    "/by_department/{department_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=list[AisleSchema] | list[SparseFields],
+)
+@cached("department:{department_id}")
+async def read_aisles_by_department(
+    db: read_db_dependency,
+    department_id: int = Path(gt=0),
+    fields: str | None = fields_query,
+):
+    field_names = AISLE_FIELDS.parse(fields)
+    query = AISLE_FIELDS.query(field_names).filter(Aisle.department_id == department_id)
+    aisles = AISLE_FIELDS.rows(await db.execute(query), field_names)
     if not len(aisles):
         raise HTTPException(status_code=404, detail="Department not found.")
-    for aisle in aisles:
-        delattr(aisle, "department")
-        delattr(aisle, "products")
-    add_href(aisles)
-    return aisles
+    return AISLE_FIELDS.serialize(aisles, field_names)
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_aisle(db: db_dependency, aisle_request: AisleRequest):
+async def create_aisle(db: write_db_dependency, aisle_request: AisleRequest):
     aisle_model = Aisle(**aisle_request.model_dump())
     aisle_id = aisle_model.aisle_id
-    aisle = db.query(Aisle).filter(Aisle.aisle_id == aisle_id).first()
+    aisle = await db.scalar(select(Aisle).filter(Aisle.aisle_id == aisle_id))
     if aisle:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=f"Cannot create aisle.  Aisle already exists with aisle_id {aisle_id}",
         )
     department_id = aisle_model.department_id
-    department = (
-        db.query(Department).filter(Department.department_id == department_id).first()
+    department = await db.scalar(
+        select(Department).filter(Department.department_id == department_id)
     )
     if not department:
         raise HTTPException(
@@ -111,25 +150,98 @@ async def create_aisle(db: db_dependency, aisle_request: AisleRequest):
             detail=f"Cannot create aisle.  Department not found with department_id {department_id}",
         )
     db.add(aisle_model)
-    db.commit()
-    db.refresh(aisle_model)
+    await db.commit()
+    catalog_cache.invalidate()
+    response_cache.invalidate(
+        ["aisles", aisle_tag(aisle_id), department_tag(department_id)]
+    )
+    await db.refresh(aisle_model)
+
+
+@router.post("/bulk", status_code=status.HTTP_200_OK, response_model=BulkResult)
+async def create_aisles_bulk(
+    db: write_db_dependency,
+    aisle_requests: list[AisleRequest] = Body(min_length=1, max_length=MAX_BULK_SIZE),
+    upsert: bool = False,
+):
+    """
+    Create many aisles, or update the existing ones with upsert=true,
+    in one transaction.  Returns the result of every aisle.
+    """
+    aisle_ids = [request.aisle_id for request in aisle_requests]
+    department_ids = {request.department_id for request in aisle_requests}
+    existing_department_ids = dict(
+        (
+            await db.execute(
+                select(Aisle.aisle_id, Aisle.department_id).filter(
+                    Aisle.aisle_id.in_(aisle_ids)
+                )
+            )
+        ).all()
+    )
+    known_department_ids = set(
+        await db.scalars(
+            select(Department.department_id).filter(
+                Department.department_id.in_(department_ids)
+            )
+        )
+    )
+    duplicates = duplicate_indexes(aisle_ids)
+
+    results = []
+    rows = []
+    for index, request in enumerate(aisle_requests):
+        exists = request.aisle_id in existing_department_ids
+        if index in duplicates:
+            detail = "Duplicate aisle_id in the request"
+        elif request.department_id not in known_department_ids:
+            detail = f"Department not found with department_id {request.department_id}"
+        elif exists and not upsert:
+            detail = f"Aisle already exists with aisle_id {request.aisle_id}"
+        else:
+            detail = None
+        if detail is not None:
+            results.append(BulkItemResult(index=index, status="error", detail=detail))
+            continue
+        results.append(
+            BulkItemResult(index=index, status="updated" if exists else "created")
+        )
+        rows.append(request.model_dump())
+
+    if rows:
+        table = Aisle.__table__
+        if upsert:
+            statement = upsert_statement(table, list(rows[0]), ["aisle_id"])
+        else:
+            statement = insert(table)
+        await db.execute(statement, rows)
+        await db.commit()
+        catalog_cache.invalidate()
+        tags = ["aisles"]
+        for row in rows:
+            tags += [aisle_tag(row["aisle_id"]), department_tag(row["department_id"])]
+            if row["aisle_id"] in existing_department_ids:
+                tags.append(department_tag(existing_department_ids[row["aisle_id"]]))
+        response_cache.invalidate(tags)
+    return bulk_result(results)
 
 
 @router.put("/{aisle_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def update_aisle(
-    db: db_dependency, aisle_request: AisleRequest, aisle_id: int = Path(gt=0)
+    db: write_db_dependency, aisle_request: AisleRequest, aisle_id: int = Path(gt=0)
 ):
-    aisle_model = db.query(Aisle).filter(Aisle.aisle_id == aisle_id).first()
+    aisle_model = await db.scalar(select(Aisle).filter(Aisle.aisle_id == aisle_id))
     if aisle_model is None:
         raise HTTPException(status_code=404, detail="Aisle not found.")
+    tags = ["aisles", aisle_tag(aisle_id), department_tag(aisle_model.department_id)]
 
     aisle_model.name = aisle_request.name
     aisle_model.aisle_id = aisle_request.aisle_id
     aisle_model.rank = aisle_request.rank
     aisle_model.department_id = aisle_request.department_id
     department_id = aisle_model.department_id
-    department = (
-        db.query(Department).filter(Department.department_id == department_id).first()
+    department = await db.scalar(
+        select(Department).filter(Department.department_id == department_id)
     )
     if not department:
         raise HTTPException(
@@ -137,14 +249,61 @@ async def update_aisle(
             detail=f"Cannot update aisle.  Department not found with department_id {department_id}",
         )
     db.add(aisle_model)
-    db.commit()
-    db.refresh(aisle_model)
+    await db.commit()
+    catalog_cache.invalidate()
+    response_cache.invalidate(
+        tags + [aisle_tag(aisle_request.aisle_id), department_tag(department_id)]
+    )
+    await db.refresh(aisle_model)
+
+
+@router.patch("/{aisle_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def patch_aisle(
+    db: write_db_dependency, aisle_request: AislePatch, aisle_id: int = Path(gt=0)
+):
+    values = patch_values(aisle_request.model_dump(exclude_unset=True), "aisle")
+    aisles = Aisle.__table__
+    tags = ["aisles", aisle_tag(aisle_id)]
+    if "department_id" in values:
+        # the lists of the department it leaves, whatever their fields
+        old_department_id = await db.scalar(
+            select(aisles.c.department_id).where(aisles.c.aisle_id == aisle_id)
+        )
+        if old_department_id is not None:
+            tags.append(department_tag(old_department_id))
+    row = await execute_patch(
+        db,
+        update(aisles)
+        .where(aisles.c.aisle_id == aisle_id)
+        .values(values)
+        .returning(aisles.c.aisle_id, aisles.c.department_id),
+        "aisle",
+    )
+    await db.commit()
+    catalog_cache.invalidate()
+    # the responses with the aisle, and the lists of its department
+    response_cache.invalidate(
+        tags + [aisle_tag(row.aisle_id), department_tag(row.department_id)]
+    )
 
 
 @router.delete("/{aisle_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_aisle(db: db_dependency, aisle_id: int):
-    aisle_model = db.query(Aisle).filter(Aisle.aisle_id == aisle_id).first()
+async def delete_aisle(db: write_db_dependency, aisle_id: int):
+    aisle_model = await db.scalar(select(Aisle).filter(Aisle.aisle_id == aisle_id))
     if aisle_model is None:
         raise HTTPException(status_code=404, detail="Aisle not found.")
-    db.query(Aisle).filter(Aisle.aisle_id == aisle_id).delete()
-    db.commit()
+    # a product response without aisle_id (fields=name) is only tagged
+    # with the product
+    product_ids = await db.scalars(
+        select(Product.product_id).filter(Product.aisle_id == aisle_id)
+    )
+    tags = ["aisles", aisle_tag(aisle_id), department_tag(aisle_model.department_id)]
+    tags += [product_tag(product_id) for product_id in product_ids]
+    await db.execute(delete(Aisle).filter(Aisle.aisle_id == aisle_id))
+    await db.commit()
+    catalog_cache.invalidate()
+    # the products of the aisle are deleted by cascade
+    response_cache.invalidate(tags)
+    # its products and their sections are deleted by cascade
+    autocomplete_index.invalidate()
+    section_graph.invalidate()
@@ -0,0 +1,47 @@
+from typing import Annotated
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, Header, Response
+from starlette import status
+from src.catalog import catalog_cache
+from src.database import get_read_db
+
+router = APIRouter(
+    #
+    prefix="/catalog",
+    tags=["catalog"],
+)
+
+
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() not in ("gzip", "*"):
+            continue
+        quality = params.strip().removeprefix("q=")
+        try:
+            return not params or float(quality) > 0
+        except ValueError:
+            return True
+    return False
+
+
+@router.get("", status_code=status.HTTP_200_OK)
+async def read_catalog(
+    db: read_db_dependency,
+    accept_encoding: Annotated[str, Header()] = "",
+):
+    """
+    All departments in rank order, with their aisles and products.
+    The response is gzipped when the client accepts it.
+    """
+    catalog = await catalog_cache.get(db)
+    headers = {"Vary": "Accept-Encoding"}
+    if accepts_gzip(accept_encoding):
+        headers["Content-Encoding"] = "gzip"
+        return Response(
+            catalog.gzip_body, media_type="application/json", headers=headers
+        )
+    return Response(catalog.body, media_type="application/json", headers=headers)
@@ -1,10 +1,25 @@
 from typing import Annotated
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session, joinedload, noload
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload, selectinload
 from fastapi import APIRouter, Depends, HTTPException, Path
 from starlette import status
-from src.models import Aisle, Department, Product
-from src.database import SessionLocal, get_db
+from src.models import Aisle, Department
+from src.catalog import catalog_cache
+from src.fieldsets import DEPARTMENT_FIELDS, ensure_no_fields, fields_query
+from src.partial_update import execute_patch, patch_values
+from src.response_cache import cached, department_tag, response_cache
+from src.autocomplete import autocomplete_index
+from src.section_graph import section_graph
+from src.database import get_read_db, get_write_db
+from src.http_cache import conditional_get
+from src.schemas import (
+    DepartmentSchema,
+    DepartmentWithAisles,
+    DepartmentWithProducts,
+    SparseFields,
+)
 
 # from .auth import get_current_user
 
@@ -12,15 +27,24 @@ router = APIRouter(
     #
     prefix="/departments",
     tags=["departments"],
+    dependencies=[Depends(conditional_get)],
 )
 
 
-db_dependency = Annotated[Session, Depends(get_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
+write_db_dependency = Annotated[AsyncSession, Depends(get_write_db)]
 
 
-def add_href(models: list[BaseModel]) -> None:
-    for model in models:
-        model.href
+def department_tree_options() -> tuple:
+    """
+    Load the aisles of a department, then the products of the aisles, with
+    one "SELECT ... WHERE ... IN" each.  A joinedload of both levels reads
+    one wide row per product, repeating the department and aisle columns.
+    The relationships of the products (sections, aisle) are never loaded.
+    """
+    return (
+        selectinload(Department.aisles).selectinload(Aisle.products).raiseload("*"),
+    )
 
 
 class DepartmentRequest(BaseModel):
@@ -29,70 +53,85 @@ class DepartmentRequest(BaseModel):
     rank: int = Field()
 
 
-@router.get("/", status_code=status.HTTP_200_OK)
-async def read_departments(db: db_dependency):
-    departments = db.query(Department).all()
-    add_href(departments)
-    return departments
+class DepartmentPatch(BaseModel):
+    """Only the fields in the request are updated"""
+
+    department_id: int = Field(default=None, ge=0)
+    name: str = Field(default=None)
+    rank: int = Field(default=None)
 
 
-@router.get("/{department_id}", status_code=status.HTTP_200_OK)
+@router.get(
+    "/",
+    status_code=status.HTTP_200_OK,
+    response_model=list[DepartmentSchema] | list[SparseFields],
+)
+@cached("departments")
+async def read_departments(db: read_db_dependency, fields: str | None = fields_query):
+    field_names = DEPARTMENT_FIELDS.parse(fields)
+    departments = DEPARTMENT_FIELDS.rows(
+        await db.execute(DEPARTMENT_FIELDS.query(field_names)), field_names
+    )
+    return DEPARTMENT_FIELDS.serialize(departments, field_names)
+
+
+@router.get(
+    "/{department_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=DepartmentWithProducts
+    | DepartmentWithAisles
+    | DepartmentSchema
+    | SparseFields,
+)
+@cached("department:{department_id}")
 async def read_department(
-    db: db_dependency,
+    db: read_db_dependency,
     department_id: int = Path(gt=0),
     with_aisles: bool = False,
     with_aisles_and_products: bool = False,
+    fields: str | None = fields_query,
 ):
+    field_names = DEPARTMENT_FIELDS.parse(fields)
+    if with_aisles or with_aisles_and_products:
+        ensure_no_fields(field_names, "with_aisles or with_aisles_and_products")
+    if field_names is not None:
+        row = (
+            await db.execute(
+                DEPARTMENT_FIELDS.query(field_names).filter(
+                    Department.department_id == department_id
+                )
+            )
+        ).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Department not found.")
+        return DEPARTMENT_FIELDS.to_dict(row, field_names)
     if with_aisles_and_products:
-        department_model = (
-            db.query(Department)
-            .options(joinedload("*"))
-            .filter(Department.department_id == department_id)
-            .first()
-        )
+        schema = DepartmentWithProducts
+        options = department_tree_options()
     elif with_aisles:
-        department_model = (
-            db.query(Department)
-            .options(joinedload(Department.aisles))
-            .filter(Department.department_id == department_id)
-            .first()
-        )
+        schema = DepartmentWithAisles
+        options = (selectinload(Department.aisles).raiseload("*"),)
     else:
-        department_model = (
-            db.query(Department)
-            .options(noload("*"))
-            .filter(Department.department_id == department_id)
-            .first()
-        )
-        # if hasattr(department_model, "aisles"):
-        #     delattr(department_model, "aisles")
+        schema = DepartmentSchema
+        options = (raiseload("*"),)
+    department_model = await db.scalar(
+        select(Department)
+        .options(*options)
+        .filter(Department.department_id == department_id)
+    )
     if department_model is None:
         raise HTTPException(status_code=404, detail="Department not found.")
-    department_model.href
-    if hasattr(department_model, "aisles"):
-        if not (with_aisles or with_aisles_and_products):
-            delattr(department_model, "aisles")
-        else:
-            aisles: list[Aisle] = department_model.aisles
-            for aisle in aisles:
-                aisle.href
-                if hasattr(aisle, "products"):
-                    if not with_aisles_and_products:
-                        delattr(aisle, "products")
-                    else:
-                        products: list[Product] = aisle.products
-                        for product in products:
-                            product.href
-                            product.remove_section_relationships()
-    return department_model
+    return schema.model_validate(department_model)
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_department(db: db_dependency, department_request: DepartmentRequest):
+async def create_department(
+    db: write_db_dependency, department_request: DepartmentRequest
+):
     department_model = Department(**department_request.model_dump())
     department_id = department_model.department_id
-    department = (
-        db.query(Department).filter(Department.department_id == department_id).first()
+    department = await db.scalar(
+        select(Department).filter(Department.department_id == department_id)
     )
     if department:
         raise HTTPException(
@@ -100,18 +139,20 @@ async def create_department(db: db_dependency, department_request: DepartmentReq
             detail=f"Cannot create department.  Department already exists with department_id {department_id}",
         )
     db.add(department_model)
-    db.commit()
-    db.refresh(department_model)
+    await db.commit()
+    catalog_cache.invalidate()
+    response_cache.invalidate(["departments", department_tag(department_id)])
+    await db.refresh(department_model)
 
 
 @router.put("/{department_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def update_department(
-    db: db_dependency,
+    db: write_db_dependency,
     department_request: DepartmentRequest,
     department_id: int = Path(gt=0),
 ):
-    department_model = (
-        db.query(Department).filter(Department.department_id == department_id).first()
+    department_model = await db.scalar(
+        select(Department).filter(Department.department_id == department_id)
     )
     if department_model is None:
         raise HTTPException(status_code=404, detail="Department not found.")
@@ -121,16 +162,60 @@ async def update_department(
     department_model.rank = department_request.rank
 
     db.add(department_model)
-    db.commit()
-    db.refresh(department_model)
+    await db.commit()
+    catalog_cache.invalidate()
+    response_cache.invalidate(
+        [
+            "departments",
+            department_tag(department_id),
+            department_tag(department_request.department_id),
+        ]
+    )
+    await db.refresh(department_model)
+
+
+@router.patch("/{department_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def patch_department(
+    db: write_db_dependency,
+    department_request: DepartmentPatch,
+    department_id: int = Path(gt=0),
+):
+    values = patch_values(
+        department_request.model_dump(exclude_unset=True), "department"
+    )
+    departments = Department.__table__
+    row = await execute_patch(
+        db,
+        update(departments)
+        .where(departments.c.department_id == department_id)
+        .values(values)
+        .returning(departments.c.department_id),
+        "department",
+    )
+    await db.commit()
+    catalog_cache.invalidate()
+    response_cache.invalidate(
+        [
+            "departments",
+            department_tag(department_id),
+            department_tag(row.department_id),
+        ]
+    )
 
 
 @router.delete("/{department_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_department(db: db_dependency, department_id: int):
-    department_model = (
-        db.query(Department).filter(Department.department_id == department_id).first()
+async def delete_department(db: write_db_dependency, department_id: int):
+    department_model = await db.scalar(
+        select(Department).filter(Department.department_id == department_id)
     )
     if department_model is None:
         raise HTTPException(status_code=404, detail="Department not found.")
-    db.query(Department).filter(Department.department_id == department_id).delete()
-    db.commit()
+    await db.execute(
+        delete(Department).filter(Department.department_id == department_id)
+    )
+    await db.commit()
+    catalog_cache.invalidate()
+    # the aisles and products of the department are deleted too
+    response_cache.clear()
+    autocomplete_index.invalidate()
+    section_graph.invalidate()
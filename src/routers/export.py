@@ -0,0 +1,134 @@
+import csv
+import enum
+import io
+from datetime import datetime, timezone
+from typing import Annotated, Any, AsyncIterator, Literal
+import orjson
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from starlette import status
+from src.models import ProductBase, Section
+from src.database import get_read_sessionmaker
+
+"""
+Whole tables, streamed as NDJSON (one JSON object per line) or CSV.
+
+The rows are read from a server side cursor EXPORT_BATCH_SIZE at a time,
+and each batch is sent before the next is read, so the memory used does
+not depend on the size of the table.
+
+updated_since exports only the rows inserted or updated since then, for
+an incremental sync.  Deleted rows are not reported.
+"""
+
+EXPORT_BATCH_SIZE = 1000
+ExportFormat = Literal["ndjson", "csv"]
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+router = APIRouter(
+    #
+    prefix="/export",
+    tags=["export"],
+)
+
+
+read_sessionmaker_dependency = Annotated[
+    async_sessionmaker[AsyncSession], Depends(get_read_sessionmaker)
+]
+format_query = Query(default="ndjson", alias="format")
+updated_since_query = Query(
+    default=None, description="Only the rows inserted or updated since then"
+)
+
+
+def csv_value(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_ndjson(names: list[str], rows: list) -> bytes:
+    return b"".join(orjson.dumps(dict(zip(names, row))) + b"\n" for row in rows)
+
+
+def encode_csv(names: list[str], rows: list) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def stream_rows(
+    session_maker: async_sessionmaker[AsyncSession],
+    query: Select,
+    export_format: ExportFormat,
+) -> AsyncIterator[bytes]:
+    encode = encode_csv if export_format == "csv" else encode_ndjson
+    # plain str, orjson does not take the str subclass of column names
+    names = [str(column.name) for column in query.selected_columns]
+    if export_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(names)
+        yield buffer.getvalue().encode()
+    async with session_maker() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield encode(names, rows)
+
+
+def export_response(
+    session_maker: async_sessionmaker[AsyncSession],
+    query: Select,
+    export_format: ExportFormat,
+) -> StreamingResponse:
+    return StreamingResponse(
+        stream_rows(session_maker, query, export_format),
+        media_type=MEDIA_TYPES[export_format],
+    )
+
+
+def filter_updated_since(
+    query: Select, updated_at, updated_since: datetime | None
+) -> Select:
+    if updated_since is None:
+        return query
+    if updated_since.tzinfo is not None:
+        # updated_at is stored in UTC without a time zone
+        updated_since = updated_since.astimezone(timezone.utc).replace(tzinfo=None)
+    return query.filter(updated_at >= updated_since)
+
+
+@router.get(
+    "/products", status_code=status.HTTP_200_OK, response_class=StreamingResponse
+)
+async def export_products(
+    session_maker: read_sessionmaker_dependency,
+    export_format: ExportFormat = format_query,
+    updated_since: datetime | None = updated_since_query,
+):
+    products = ProductBase.__table__
+    query = select(products).order_by(products.c.product_id)
+    query = filter_updated_since(query, products.c.updated_at, updated_since)
+    return export_response(session_maker, query, export_format)
+
+
+@router.get(
+    "/sections", status_code=status.HTTP_200_OK, response_class=StreamingResponse
+)
+async def export_sections(
+    session_maker: read_sessionmaker_dependency,
+    export_format: ExportFormat = format_query,
+    updated_since: datetime | None = updated_since_query,
+):
+    sections = Section.__table__
+    query = select(sections).order_by(
+        sections.c.parent_product_id,
+        sections.c.section_type,
+        sections.c.child_product_id,
+    )
+    query = filter_updated_since(query, sections.c.updated_at, updated_since)
+    return export_response(session_maker, query, export_format)
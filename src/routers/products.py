@@ -1,19 +1,82 @@
-from typing import Annotated
+from typing import Annotated, Literal
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session, noload, joinedload
-from fastapi import APIRouter, Depends, HTTPException, Path
+from sqlalchemy import Select, and_, delete, insert, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload
+from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query
 from starlette import status
-from src.models import Product, Aisle, Section, SectionType, ProductBase
-from src.database import get_db
+from src.models import (
+    Product,
+    Aisle,
+    ProductBase,
+    parse_price_cents,
+)
+from src.autocomplete import (
+    DEFAULT_SUGGESTIONS,
+    MAX_SUGGESTIONS,
+    autocomplete_index,
+)
+from src.bulk import MAX_BULK_SIZE, bulk_result, duplicate_indexes, upsert_statement
+from src.catalog import catalog_cache
+from src.fieldsets import PRODUCT_FIELDS, ensure_no_fields, fields_query
+from src.partial_update import execute_patch, patch_values
+from src.product_filters import (
+    ListingScope,
+    ProductFilters,
+    listing_parameters,
+    listing_shape,
+    listing_statements,
+)
+from src.response_cache import (
+    aisle_tag,
+    cached,
+    department_tag,
+    product_tag,
+    response_cache,
+)
+from src.database import get_read_db, get_write_db
+from src.http_cache import conditional_get
+from src.schemas import (
+    BulkItemResult,
+    BulkResult,
+    Page,
+    ProductBatch,
+    ProductSchema,
+    ProductSuggestion,
+    ProductWithSections,
+    SparseFields,
+)
+from src.search import filter_search, match_query, search_score
+from src.section_graph import section_graph
+from src.section_loader import SectionsDict, load_sections
+from src.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, make_page
 
 router = APIRouter(
     #
     prefix="/products",
     tags=["products"],
+    dependencies=[Depends(conditional_get)],
 )
 
 
-db_dependency = Annotated[Session, Depends(get_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
+write_db_dependency = Annotated[AsyncSession, Depends(get_write_db)]
+
+"""
+Product lists can be filtered by price in dollars, and sorted by
+"rank" (catalog order) or "price" (ascending, products without a price
+first).  Both use the indexed price_cents column.
+"""
+min_price_query = Query(default=None, ge=0, description="Minimum price in dollars")
+max_price_query = Query(default=None, ge=0, description="Maximum price in dollars")
+ProductSort = Literal["rank", "price"]
+
+"""
+/products/batch reads many products by id with one query, e.g. the
+children of a product's sections.  GET takes a comma separated list
+(?ids=1001,1002), POST a JSON body for longer lists.
+"""
+MAX_BATCH_SIZE = 100
 
 
 class ProductRequest(BaseModel):
@@ -30,32 +93,36 @@ class ProductRequest(BaseModel):
 
 
 class ProductPatch(BaseModel):
+    """Only the fields in the request are updated"""
+
     name: str = Field(default=None)
-    product_id: int = Field(default=None)
-    rank: int = Field(default=None)
-    src: str = Field(default=None)
-    alt: str = Field(default=None)
-    price: str = Field(default=None)
-    size: str = Field(default=None)
-    aisle_id: int = Field(default=None)
-    price_per: str = Field(default=None)
-    affix: str = Field(default=None)
-
-
-def get_product(product_id: int, db: Session):
-    product_model = (
-        db.query(Product)
-        .options(noload("*"))
-        .filter(Product.product_id == product_id)
-        .first()
+    product_id: int = Field(default=None, ge=0)
+    rank: int = Field(default=None, gt=0)
+    src: str | None = Field(default=None)
+    alt: str | None = Field(default=None)
+    price: str | None = Field(default=None)
+    size: str | None = Field(default=None)
+    aisle_id: int = Field(default=None, ge=0)
+    price_per: str | None = Field(default=None)
+    affix: str | None = Field(default=None)
+
+
+class ProductBatchRequest(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+    with_sections: bool = False
+
+
+async def get_product(product_id: int, db: AsyncSession):
+    product_model = await db.scalar(
+        select(Product).options(noload("*")).filter(Product.product_id == product_id)
     )
     if product_model is None:
         raise HTTPException(status_code=404, detail="Product not found.")
     return product_model
 
 
-def ensure_aisle_exists(aisle_id: int, db: Session):
-    aisle = db.query(Aisle).filter(Aisle.aisle_id == aisle_id).first()
+async def ensure_aisle_exists(aisle_id: int, db: AsyncSession):
+    aisle = await db.scalar(select(Aisle).filter(Aisle.aisle_id == aisle_id))
     if not aisle:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
@@ -63,94 +130,424 @@ def ensure_aisle_exists(aisle_id: int, db: Session):
         )
 
 
-@router.get("/", status_code=status.HTTP_200_OK)
-async def read_products(db: db_dependency):
-    return db.query(Product).all()
+async def product_cache_tags(
+    db: AsyncSession, product_ids: list[int], aisle_ids: list[int]
+) -> list[str]:
+    """The response cache tags of products, their aisles and departments"""
+    department_ids = await db.scalars(
+        select(Aisle.department_id).filter(Aisle.aisle_id.in_(aisle_ids))
+    )
+    return (
+        [product_tag(product_id) for product_id in product_ids]
+        + [aisle_tag(aisle_id) for aisle_id in aisle_ids]
+        + [department_tag(department_id) for department_id in department_ids]
+    )
 
 
-@router.get("/{product_id}", status_code=status.HTTP_200_OK)
-async def read_product(
-    db: db_dependency, product_id: int = Path(gt=0), with_sections: bool = False
-):
-    product_model = (
-        db.query(ProductBase)
-        .options(noload("*"))
-        .filter(Product.product_id == product_id)
-        .first()
+def parse_product_ids(ids: list[str]) -> list[int]:
+    try:
+        product_ids = [
+            int(id) for value in ids for id in value.split(",") if id.strip()
+        ]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="ids must be a comma separated list of product ids",
+        )
+    if not 0 < len(product_ids) <= MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Between 1 and {MAX_BATCH_SIZE} product ids are required",
+        )
+    return product_ids
+
+
+def add_sections(product: ProductSchema, sections: SectionsDict) -> ProductWithSections:
+    return ProductWithSections(
+        **product.model_dump(),
+        sections={
+            section_type: [ProductSchema.model_validate(child) for child in children]
+            for section_type, children in sections.items()
+        },
     )
-    if product_model is None:
-        raise HTTPException(status_code=404, detail="Product not found.")
 
-    product_model.href
+
+async def read_product_batch(
+    db: AsyncSession, product_ids: list[int], with_sections: bool
+) -> ProductBatch:
+    product_ids = list(dict.fromkeys(product_ids))
+    product_models = await db.scalars(
+        select(ProductBase).filter(ProductBase.product_id.in_(product_ids))
+    )
+    products_by_id = {
+        product.product_id: ProductSchema.model_validate(product)
+        for product in product_models
+    }
+    products = [
+        products_by_id[product_id]
+        for product_id in product_ids
+        if product_id in products_by_id
+    ]
     if with_sections:
-        # rank for the sections should be a member of the sections table
-        # and sections loaded with order_by rank
-        section_models = (
-            db.query(Section)
-            # .options(joinedload(Section.child))
-            .filter(Section.parent_product_id == product_id).all()
+        sections = await load_sections(db, products_by_id.keys())
+        products = [
+            add_sections(product, sections[product.product_id]) for product in products
+        ]
+    return ProductBatch(
+        products=products,
+        missing=[
+            product_id for product_id in product_ids if product_id not in products_by_id
+        ],
+    )
+
+
+def filter_by_price(
+    query: Select, min_price: float | None, max_price: float | None
+) -> Select:
+    if min_price is not None:
+        query = query.filter(Product.price_cents >= round(min_price * 100))
+    if max_price is not None:
+        query = query.filter(Product.price_cents <= round(max_price * 100))
+    return query
+
+
+async def read_product_listing(
+    db: AsyncSession,
+    scope: ListingScope,
+    scope_id: int,
+    filters: ProductFilters,
+    fields: str | None,
+):
+    field_names = PRODUCT_FIELDS.parse(fields)
+    statement = await listing_statements.get(
+        db, listing_shape(scope, filters, field_names)
+    )
+    result = await db.execute(statement, listing_parameters(scope_id, filters))
+    products = PRODUCT_FIELDS.rows(result, field_names)
+    # with filters an existing aisle or department can have no matching products
+    if not len(products) and not filters.given():
+        raise HTTPException(status_code=404, detail=f"{scope.capitalize()} not found.")
+    return PRODUCT_FIELDS.serialize(products, field_names)
+
+
+@router.get(
+    "/",
+    status_code=status.HTTP_200_OK,
+    response_model=Page[ProductSchema] | Page[SparseFields],
+)
+async def read_products(
+    db: read_db_dependency,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    min_price: float | None = min_price_query,
+    max_price: float | None = max_price_query,
+    sort: ProductSort = "rank",
+    fields: str | None = fields_query,
+):
+    """
+    Products in catalog order (or by price), a page at a time.
+    Pass the "next" cursor of a page to read the following page.
+    """
+    if sort == "price":
+        sort_key = (Product.price_cents, Product.product_id)
+        # products without a price have a NULL price_cents
+        key_types = ((int, type(None)), int)
+    else:
+        sort_key = (Product.aisle_id, Product.rank, Product.product_id)
+        key_types = (int, int, int)
+    field_names = PRODUCT_FIELDS.parse(fields)
+    query = PRODUCT_FIELDS.query(field_names, *sort_key)
+    query = query.order_by(*sort_key).limit(limit + 1)
+    query = filter_by_price(query, min_price, max_price)
+    if cursor is not None:
+        key = decode_cursor(cursor, key_types)
+        if sort == "price" and key[0] is None:
+            # NULL prices sort first, and do not compare in a row value
+            query = query.filter(
+                or_(
+                    and_(Product.price_cents.is_(None), Product.product_id > key[1]),
+                    Product.price_cents.is_not(None),
+                )
+            )
+        else:
+            query = query.filter(tuple_(*sort_key) > tuple(key))
+    products = PRODUCT_FIELDS.rows(await db.execute(query), field_names)
+    page = make_page(
+        products,
+        limit,
+        lambda product: tuple(getattr(product, column.key) for column in sort_key),
+    )
+    page["items"] = PRODUCT_FIELDS.serialize(page["items"], field_names)
+    return page
+
+
+@router.get(
+    "/search", status_code=status.HTTP_200_OK, response_model=Page[ProductSchema]
+)
+async def search_products(
+    db: read_db_dependency,
+    q: str = Query(min_length=1, description="Words the products start with"),
+    aisle_id: int | None = Query(default=None, gt=0),
+    department_id: int | None = Query(default=None, gt=0),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+):
+    """
+    Products with a word starting with each word of q in their name, alt
+    or size, best match first, a page at a time.
+    """
+    match = match_query(q)
+    if match is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="q must contain at least one word",
         )
-        if section_models is None:
-            raise HTTPException(status_code=404, detail="Section not found.")
-        sections = {}
-        for section_type in SectionType._member_names_:
-            sections[section_type] = []
-        for model in section_models:
-            if model.child:
-                model.child.href
-                section = SectionType(model.section_type).name
-                sections[section].append(model.child)
-        setattr(product_model, "sections", sections)
-    if hasattr(product_model, "aisle"):
-        delattr(product_model, "aisle")
-    return product_model
+    score = search_score()
+    query = filter_search(select(Product, score), Product.id, match)
+    query = query.order_by(score, Product.id).limit(limit + 1)
+    if aisle_id is not None:
+        query = query.filter(Product.aisle_id == aisle_id)
+    if department_id is not None:
+        query = query.join(Aisle).filter(Aisle.department_id == department_id)
+    if cursor is not None:
+        query = query.filter(
+            tuple_(score, Product.id)
+            > tuple(decode_cursor(cursor, ((int, float), int)))
+        )
+    rows = (await db.execute(query)).all()
+    page = make_page(rows, limit, lambda row: (row[1], row[0].id))
+    page["items"] = [ProductSchema.model_validate(row[0]) for row in page["items"]]
+    return page
 
 
-@router.get("/by_aisle/{aisle_id}", status_code=status.HTTP_200_OK)
-async def read_products_by_aisle(db: db_dependency, aisle_id: int = Path(gt=0)):
-    products = db.query(Product).filter(Product.aisle_id == aisle_id).all()
-    if not len(products):
-        raise HTTPException(status_code=404, detail="Aisle not found.")
-    return products
+@router.get(
+    "/suggest",
+    status_code=status.HTTP_200_OK,
+    response_model=list[ProductSuggestion],
+)
+async def suggest_products(
+    db: read_db_dependency,
+    prefix: str = Query(min_length=1, description="The start of a word of the name"),
+    limit: int = Query(default=DEFAULT_SUGGESTIONS, gt=0, le=MAX_SUGGESTIONS),
+):
+    """
+    Type-ahead suggestions: the products with a word of their name
+    starting with prefix, in rank order, from the in-memory index
+    """
+    await autocomplete_index.load(db)
+    return [
+        ProductSuggestion.model_validate(suggestion)
+        for suggestion in autocomplete_index.suggest(prefix, limit)
+    ]
+
+
+@router.get("/batch", status_code=status.HTTP_200_OK, response_model=ProductBatch)
+async def read_products_batch(
+    db: read_db_dependency,
+    ids: list[str] = Query(description="Comma separated product ids"),
+    with_sections: bool = False,
+):
+    return await read_product_batch(db, parse_product_ids(ids), with_sections)
 
 
-@router.get("/by_department/{department_id}", status_code=status.HTTP_200_OK)
-async def read_products_by_department(
-    db: db_dependency, department_id: int = Path(gt=0)
+@router.post("/batch", status_code=status.HTTP_200_OK, response_model=ProductBatch)
+async def read_products_batch_post(
+    db: read_db_dependency, batch_request: ProductBatchRequest
 ):
-    products = (
-        db.query(Product).join(Aisle).filter(Aisle.department_id == department_id).all()
+    return await read_product_batch(db, batch_request.ids, batch_request.with_sections)
+
+
+@router.get(
+    "/{product_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=ProductWithSections | ProductSchema | SparseFields,
+)
+@cached("product:{product_id}")
+async def read_product(
+    db: read_db_dependency,
+    product_id: int = Path(gt=0),
+    with_sections: bool = False,
+    fields: str | None = fields_query,
+):
+    field_names = PRODUCT_FIELDS.parse(fields)
+    if with_sections:
+        ensure_no_fields(field_names, "with_sections")
+    if field_names is not None:
+        row = (
+            await db.execute(
+                PRODUCT_FIELDS.query(field_names).filter(
+                    Product.product_id == product_id
+                )
+            )
+        ).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Product not found.")
+        return PRODUCT_FIELDS.to_dict(row, field_names)
+    product_model = await db.scalar(
+        select(ProductBase).filter(ProductBase.product_id == product_id)
     )
-    if not len(products):
-        raise HTTPException(status_code=404, detail="Department not found.")
-    return products
+    if product_model is None:
+        raise HTTPException(status_code=404, detail="Product not found.")
+    product = ProductSchema.model_validate(product_model)
+    if not with_sections:
+        return product
+    # rank for the sections should be a member of the sections table
+    # and sections loaded with order_by rank
+    sections = await load_sections(db, [product_id])
+    return add_sections(product, sections[product_id])
+
+
+@router.get(
+    "/by_aisle/{aisle_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=list[ProductSchema] | list[SparseFields],
+)
+@cached("aisle:{aisle_id}")
+async def read_products_by_aisle(
+    db: read_db_dependency,
+    filters: Annotated[ProductFilters, Depends()],
+    aisle_id: int = Path(gt=0),
+    fields: str | None = fields_query,
+):
+    """The products of an aisle, filtered and sorted (see src/product_filters.py)"""
+    return await read_product_listing(db, "aisle", aisle_id, filters, fields)
+
+
+@router.get(
+    "/by_department/{department_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=list[ProductSchema] | list[SparseFields],
+)
+@cached("department:{department_id}")
+async def read_products_by_department(
+    db: read_db_dependency,
+    filters: Annotated[ProductFilters, Depends()],
+    department_id: int = Path(gt=0),
+    fields: str | None = fields_query,
+):
+    """The products of a department, filtered and sorted (see src/product_filters.py)"""
+    return await read_product_listing(db, "department", department_id, filters, fields)
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_product(db: db_dependency, product_request: ProductRequest):
+async def create_product(db: write_db_dependency, product_request: ProductRequest):
     product_model = Product(**product_request.model_dump())
     product_id = product_model.product_id
-    product = db.query(Product).filter(Product.product_id == product_id).first()
+    product = await db.scalar(select(Product).filter(Product.product_id == product_id))
     if product:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=f"Cannot create product.  Product already exists with product_id {product_id}",
         )
     aisle_id = product_model.aisle_id
-    ensure_aisle_exists(aisle_id=aisle_id, db=db)
+    await ensure_aisle_exists(aisle_id=aisle_id, db=db)
+    tags = await product_cache_tags(db, [product_id], [aisle_id])
 
     db.add(product_model)
-    db.commit()
-    db.refresh(product_model)
+    await db.commit()
+    catalog_cache.invalidate()
+    response_cache.invalidate(tags)
+    autocomplete_index.add(product_id, product_model.name, product_model.rank)
+    await db.refresh(product_model)
+
+
+@router.post("/bulk", status_code=status.HTTP_200_OK, response_model=BulkResult)
+async def create_products_bulk(
+    db: write_db_dependency,
+    product_requests: list[ProductRequest] = Body(
+        min_length=1, max_length=MAX_BULK_SIZE
+    ),
+    upsert: bool = False,
+):
+    """
+    Create many products, or update the existing ones with upsert=true,
+    in one transaction.  Returns the result of every product.
+    """
+    product_ids = [request.product_id for request in product_requests]
+    names = [request.name for request in product_requests]
+    aisle_ids = {request.aisle_id for request in product_requests}
+    existing = (
+        await db.execute(
+            select(Product.product_id, Product.name, Product.aisle_id).filter(
+                or_(Product.product_id.in_(product_ids), Product.name.in_(names))
+            )
+        )
+    ).all()
+    existing_aisle_ids = {row.product_id: row.aisle_id for row in existing}
+    product_id_by_name = {row.name: row.product_id for row in existing}
+    known_aisle_ids = set(
+        await db.scalars(select(Aisle.aisle_id).filter(Aisle.aisle_id.in_(aisle_ids)))
+    )
+    duplicates = duplicate_indexes(product_ids) | duplicate_indexes(names)
+
+    results = []
+    rows = []
+    for index, request in enumerate(product_requests):
+        product_id = request.product_id
+        exists = product_id in existing_aisle_ids
+        if index in duplicates:
+            detail = "Duplicate product_id or name in the request"
+        elif request.aisle_id not in known_aisle_ids:
+            detail = f"Aisle does not exist with aisle_id {request.aisle_id}"
+        elif exists and not upsert:
+            detail = f"Product already exists with product_id {product_id}"
+        elif product_id_by_name.get(request.name, product_id) != product_id:
+            detail = f"Another product is named {request.name}"
+        else:
+            detail = None
+        if detail is not None:
+            results.append(BulkItemResult(index=index, status="error", detail=detail))
+            continue
+        results.append(
+            BulkItemResult(index=index, status="updated" if exists else "created")
+        )
+        # the price validators of the model do not run for a core insert
+        rows.append(
+            request.model_dump()
+            | {
+                "price_cents": parse_price_cents(request.price),
+                "price_per_cents": parse_price_cents(request.price_per),
+            }
+        )
+
+    if rows:
+        table = Product.__table__
+        if upsert:
+            statement = upsert_statement(table, list(rows[0]), ["product_id"])
+        else:
+            statement = insert(table)
+        written_ids = [row["product_id"] for row in rows]
+        tags = await product_cache_tags(
+            db,
+            written_ids,
+            [row["aisle_id"] for row in rows]
+            + [
+                existing_aisle_ids[id] for id in written_ids if id in existing_aisle_ids
+            ],
+        )
+        await db.execute(statement, rows)
+        await db.commit()
+        catalog_cache.invalidate()
+        response_cache.invalidate(tags)
+        for row in rows:
+            autocomplete_index.add(row["product_id"], row["name"], row["rank"])
+    return bulk_result(results)
 
 
 @router.put("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def update_product(
-    db: db_dependency, product_request: ProductRequest, product_id: int = Path(gt=0)
+    db: write_db_dependency,
+    product_request: ProductRequest,
+    product_id: int = Path(gt=0),
 ):
-    product_model = get_product(product_id=product_id, db=db)
+    product_model = await get_product(product_id=product_id, db=db)
     aisle_id = product_request.aisle_id
-    ensure_aisle_exists(aisle_id=aisle_id, db=db)
+    await ensure_aisle_exists(aisle_id=aisle_id, db=db)
+    tags = await product_cache_tags(
+        db,
+        [product_id, product_request.product_id],
+        [product_model.aisle_id, aisle_id],
+    )
 
     product_model.name = product_request.name
     product_model.product_id = product_request.product_id
@@ -164,42 +561,74 @@ async def update_product(
     product_model.aisle_id = aisle_id
 
     db.add(product_model)
-    db.commit()
-    db.refresh(product_model)
+    await db.commit()
+    catalog_cache.invalidate()
+    response_cache.invalidate(tags)
+    autocomplete_index.remove(product_id)
+    autocomplete_index.add(
+        product_model.product_id, product_model.name, product_model.rank
+    )
+    await db.refresh(product_model)
 
 
 @router.patch("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def patch_product(
-    db: db_dependency, product_request: ProductPatch, product_id: int = Path(gt=0)
+    db: write_db_dependency, product_request: ProductPatch, product_id: int = Path(gt=0)
 ):
-    product_model = db.query(Product).filter(Product.product_id == product_id).first()
-    if product_model is None:
-        raise HTTPException(status_code=404, detail="Product not found.")
-    if product_request.name:
-        product_model.name = product_request.name
-    if product_request.product_id:
-        product_model.product_id = product_request.product_id
-    if product_request.rank:
-        product_model.rank = product_request.rank
-    if product_request.src:
-        product_model.src = product_request.src
-    if product_request.alt:
-        product_model.alt = product_request.alt
-    if product_request.price:
-        product_model.price = product_request.price
-    if product_request.aisle_id:
-        ensure_aisle_exists(aisle_id=product_request.aisle_id, db=db)
-        product_model.aisle_id = product_request.aisle_id
-
-    db.add(product_model)
-    db.commit()
-    db.refresh(product_model)
+    values = patch_values(product_request.model_dump(exclude_unset=True), "product")
+    # the price validators of the model do not run for a core update
+    if "price" in values:
+        values["price_cents"] = parse_price_cents(values["price"])
+    if "price_per" in values:
+        values["price_per_cents"] = parse_price_cents(values["price_per"])
+    products = ProductBase.__table__
+    department_id = (
+        select(Aisle.department_id)
+        .filter(Aisle.aisle_id == products.c.aisle_id)
+        .scalar_subquery()
+        .label("department_id")
+    )
+    row = await execute_patch(
+        db,
+        update(products)
+        .where(products.c.product_id == product_id)
+        .values(values)
+        .returning(
+            products.c.product_id,
+            products.c.name,
+            products.c.rank,
+            products.c.aisle_id,
+            department_id,
+        ),
+        "product",
+    )
+    await db.commit()
+    catalog_cache.invalidate()
+    # the responses with the product are tagged with it, wherever it was
+    response_cache.invalidate(
+        [
+            product_tag(product_id),
+            product_tag(row.product_id),
+            aisle_tag(row.aisle_id),
+            department_tag(row.department_id),
+        ]
+    )
+    autocomplete_index.remove(product_id)
+    autocomplete_index.add(row.product_id, row.name, row.rank)
 
 
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_product(db: db_dependency, product_id: int):
-    product_model = db.query(Product).filter(Product.product_id == product_id).first()
+async def delete_product(db: write_db_dependency, product_id: int):
+    product_model = await db.scalar(
+        select(Product).filter(Product.product_id == product_id)
+    )
     if product_model is None:
         raise HTTPException(status_code=404, detail="Product not found.")
-    db.query(Product).filter(Product.product_id == product_id).delete()
-    db.commit()
+    tags = await product_cache_tags(db, [product_id], [product_model.aisle_id])
+    await db.execute(delete(Product).filter(Product.product_id == product_id))
+    await db.commit()
+    catalog_cache.invalidate()
+    response_cache.invalidate(tags)
+    autocomplete_index.remove(product_id)
+    # the sections of the product are deleted by cascade
+    section_graph.invalidate()
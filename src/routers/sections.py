@@ -3,11 +3,34 @@ from pydantic import BaseModel, Field, field_validator, model_validator
 from box import Box
 
 # from sqlalchemy import Enum
-from sqlalchemy.orm import Session, noload, joinedload
-from fastapi import APIRouter, Depends, HTTPException, Path
+from sqlalchemy import delete, insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload, joinedload
+from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query
 from starlette import status
 from src.models import SectionType, Section, Product
-from src.database import get_db
+from src.bulk import MAX_BULK_SIZE, bulk_result, duplicate_indexes
+from src.catalog import catalog_cache
+from src.response_cache import cached, product_tag, response_cache
+from src.database import get_read_db, get_write_db
+from src.http_cache import conditional_get
+from src.schemas import (
+    BulkItemResult,
+    BulkResult,
+    Page,
+    ProductSchema,
+    SectionRecommendation,
+    SectionSchema,
+    SectionsSchema,
+)
+from src.section_graph import (
+    DEFAULT_RECOMMENDATIONS,
+    MAX_GRAPH_DEPTH,
+    MAX_RECOMMENDATIONS,
+    section_graph,
+)
+from src.section_loader import load_sections
+from src.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, make_page
 
 # from .auth import get_current_user
 
@@ -15,10 +38,12 @@ router = APIRouter(
     #
     prefix="/sections",
     tags=["sections"],
+    dependencies=[Depends(conditional_get)],
 )
 
 
-db_dependency = Annotated[Session, Depends(get_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
+write_db_dependency = Annotated[AsyncSession, Depends(get_write_db)]
 
 
 class SectionRequest(BaseModel):
@@ -63,8 +88,8 @@ class SectionRequest(BaseModel):
         return self
 
 
-def ensure_product_exists(product_id: int, db: Session):
-    product = db.query(Product).filter(Product.product_id == product_id).first()
+async def ensure_product_exists(product_id: int, db: AsyncSession):
+    product = await db.scalar(select(Product).filter(Product.product_id == product_id))
     if not product:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
@@ -72,21 +97,50 @@ def ensure_product_exists(product_id: int, db: Session):
         )
 
 
-@router.get("/", status_code=status.HTTP_200_OK)
-async def read_sections(db: db_dependency):
-    sections = (
+@router.get("/", status_code=status.HTTP_200_OK, response_model=Page[SectionSchema])
+async def read_sections(
+    db: read_db_dependency,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+):
+    """
+    Sections ordered by their primary key, a page at a time.
+    Pass the "next" cursor of a page to read the following page.
+    """
+    sort_key = (
+        Section.parent_product_id,
+        Section.section_type,
+        Section.child_product_id,
+    )
+    query = (
         #
-        db.query(Section)
-        .order_by(Section.parent_product_id, Section.section_type)
+        select(Section)
+        .order_by(*sort_key)
         .options(noload("*"))
-        .all()
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        parent_product_id, section_type, child_product_id = decode_cursor(
+            cursor, (int, str, int)
+        )
+        if section_type not in SectionType.__members__:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor."
+            )
+        query = query.filter(
+            tuple_(*sort_key)
+            > (parent_product_id, SectionType[section_type], child_product_id)
+        )
+    sections = (await db.execute(query)).scalars().all()
+    return make_page(
+        [SectionSchema.model_validate(section) for section in sections],
+        limit,
+        lambda section: (
+            section.parent_product_id,
+            SectionType(section.section_type).name,
+            section.child_product_id,
+        ),
     )
-    for section in sections:
-        if hasattr(section, "parent"):
-            delattr(section, "parent")
-        if hasattr(section, "child"):
-            delattr(section, "child")
-    return sections
 
 
 """
@@ -96,42 +150,163 @@ async def read_sections(db: db_dependency):
 """
 
 
+@router.get(
+    "/graph/{product_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=list[SectionRecommendation],
+)
+async def read_section_graph(
+    db: read_db_dependency,
+    product_id: int = Path(gt=0),
+    depth: int = Query(default=2, gt=0, le=MAX_GRAPH_DEPTH),
+    section_type: (
+        Literal["featured_products", "related_items", "often_bought_with"] | None
+    ) = Query(default=None, alias="type", description="All types by default"),
+    limit: int = Query(default=DEFAULT_RECOMMENDATIONS, gt=0, le=MAX_RECOMMENDATIONS),
+):
+    """
+    Recommendations: the products up to depth sections away from the
+    product, best scored first, from the in-memory section graph.
+    Read the products with /products/batch.
+    """
+    await section_graph.load(db)
+    section_types = SectionType if section_type is None else [SectionType[section_type]]
+    return [
+        SectionRecommendation.model_validate(recommendation)
+        for recommendation in section_graph.recommend(
+            product_id, depth, section_types, limit
+        )
+    ]
+
+
 @router.get(
     "/{section_type}/{parent_product_id}/{child_product_id}",
     status_code=status.HTTP_200_OK,
+    response_model=SectionSchema,
 )
 async def read_section(
-    db: db_dependency,
+    db: read_db_dependency,
     section_type: SectionType,
     # section_type: Literal["featured_products", "often_bought_with", "related_items"],
     parent_product_id: int,
     child_product_id: int,
 ):
-    section_model = (
-        db.query(Section)
+    section_model = await db.scalar(
+        select(Section)
         # .options(noload("*"))
         .filter(Section.parent_product_id == parent_product_id)
         .filter(Section.child_product_id == child_product_id)
         .filter(Section.section_type == section_type)
-        .first()
     )
     if section_model is None:
         raise HTTPException(status_code=404, detail="Section not found.")
-    return section_model
+    return SectionSchema.model_validate(section_model)
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_section(db: db_dependency, section_request: SectionRequest):
-    ensure_product_exists(product_id=section_request.parent_product_id, db=db)
-    ensure_product_exists(product_id=section_request.child_product_id, db=db)
+async def create_section(db: write_db_dependency, section_request: SectionRequest):
+    await ensure_product_exists(product_id=section_request.parent_product_id, db=db)
+    await ensure_product_exists(product_id=section_request.child_product_id, db=db)
     section_model = Section(**section_request.model_dump())
     db.add(section_model)
-    db.commit()
+    await db.commit()
+    catalog_cache.invalidate()
+    response_cache.invalidate([product_tag(section_request.parent_product_id)])
+    section_graph.add(
+        section_request.section_type,
+        section_request.parent_product_id,
+        section_request.child_product_id,
+    )
+
+
+@router.post("/bulk", status_code=status.HTTP_200_OK, response_model=BulkResult)
+async def create_sections_bulk(
+    db: write_db_dependency,
+    section_requests: list[SectionRequest] = Body(
+        min_length=1, max_length=MAX_BULK_SIZE
+    ),
+    upsert: bool = False,
+):
+    """
+    Create many sections in one transaction.  A section has no columns
+    besides its key, so with upsert=true an existing one is "unchanged"
+    instead of an error.  Returns the result of every section.
+    """
+    keys = [
+        (request.section_type, request.parent_product_id, request.child_product_id)
+        for request in section_requests
+    ]
+    product_ids = {
+        product_id
+        for request in section_requests
+        for product_id in (request.parent_product_id, request.child_product_id)
+    }
+    known_product_ids = set(
+        await db.scalars(
+            select(Product.product_id).filter(Product.product_id.in_(product_ids))
+        )
+    )
+    existing_keys = set(
+        (
+            await db.execute(
+                select(
+                    Section.section_type,
+                    Section.parent_product_id,
+                    Section.child_product_id,
+                ).filter(
+                    tuple_(
+                        Section.section_type,
+                        Section.parent_product_id,
+                        Section.child_product_id,
+                    ).in_(keys)
+                )
+            )
+        ).all()
+    )
+    duplicates = duplicate_indexes(keys)
+
+    results = []
+    rows = []
+    for index, (request, key) in enumerate(zip(section_requests, keys)):
+        missing = [
+            product_id
+            for product_id in (request.parent_product_id, request.child_product_id)
+            if product_id not in known_product_ids
+        ]
+        if index in duplicates:
+            detail = "Duplicate section in the request"
+        elif missing:
+            detail = f"Product not found with product_id {missing[0]}"
+        elif key in existing_keys and not upsert:
+            detail = "Section already exists"
+        elif key in existing_keys:
+            results.append(BulkItemResult(index=index, status="unchanged"))
+            continue
+        else:
+            detail = None
+        if detail is not None:
+            results.append(BulkItemResult(index=index, status="error", detail=detail))
+            continue
+        results.append(BulkItemResult(index=index, status="created"))
+        rows.append(request.model_dump())
+
+    if rows:
+        await db.execute(insert(Section.__table__), rows)
+        await db.commit()
+        catalog_cache.invalidate()
+        response_cache.invalidate(
+            {product_tag(row["parent_product_id"]) for row in rows}
+        )
+        for row in rows:
+            section_graph.add(
+                row["section_type"], row["parent_product_id"], row["child_product_id"]
+            )
+    return bulk_result(results)
 
 
 # @router.put("/{section_id}", status_code=status.HTTP_204_NO_CONTENT)
 # async def update_section(
-#     db: db_dependency,
+#     db: write_db_dependency,
 #     section_request: SectionRequest,
 #     section_id: int = Path(gt=0),
 # ):
@@ -152,52 +327,44 @@ async def create_section(db: db_dependency, section_request: SectionRequest):
     status_code=status.HTTP_204_NO_CONTENT,
 )
 async def delete_section(
-    db: db_dependency,
+    db: write_db_dependency,
     section_type: SectionType,
     parent_product_id: int,
     child_product_id: int,
 ):
-    section_model = (
-        db.query(Section)
+    section_model = await db.scalar(
+        select(Section)
         # .options(noload("*"))
         .filter(Section.parent_product_id == parent_product_id)
         .filter(Section.child_product_id == child_product_id)
         .filter(Section.section_type == section_type)
-        .first()
     )
     if section_model is None:
         raise HTTPException(status_code=404, detail="Section not found.")
-    (
-        db.query(Section)
+    await db.execute(
+        delete(Section)
         .filter(Section.parent_product_id == parent_product_id)
         .filter(Section.child_product_id == child_product_id)
         .filter(Section.section_type == section_type)
-        .delete()
     )
-    db.commit()
+    await db.commit()
+    catalog_cache.invalidate()
+    response_cache.invalidate([product_tag(parent_product_id)])
+    section_graph.remove(section_type, parent_product_id, child_product_id)
 
 
 @router.get(
     "/by_parent_product_id/{parent_product_id}",
     status_code=status.HTTP_200_OK,
+    response_model=SectionsSchema,
 )
+@cached("product:{parent_product_id}")
 async def read_sections_by_product_id(
-    db: db_dependency,
+    db: read_db_dependency,
     parent_product_id: int,
 ):
-    section_models = (
-        db.query(Section)
-        .options(joinedload(Section.child))
-        .filter(Section.parent_product_id == parent_product_id)
-        .all()
-    )
-    if section_models is None:
-        raise HTTPException(status_code=404, detail="Section not found.")
-    sections = {}
-    for section_type in SectionType._member_names_:
-        sections[section_type] = []
-    for model in section_models:
-        if model.child:
-            section = SectionType(model.section_type).name
-            sections[section].append(model.child)
-    return sections
+    sections = await load_sections(db, [parent_product_id])
+    return {
+        section_type: [ProductSchema.model_validate(child) for child in children]
+        for section_type, children in sections[parent_product_id].items()
+    }
@@ -0,0 +1,138 @@
+"""
+Response models
+
+The routers return these instead of ORM objects, so only the listed fields
+are serialized, and nothing is lazy loaded or has to be removed from the
+objects (like the section relationships of a product) before encoding.
+They are built from the ORM objects with model_validate.
+
+The variants of a route's response are declared in a Union from the most
+nested to the least, so an instance of a subclass is never validated as
+its base class.
+"""
+
+from typing import Any, Generic, Literal, TypeVar
+
+from pydantic import BaseModel, ConfigDict
+
+from src.models import SectionType
+
+T = TypeVar("T")
+
+
+class DepartmentSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    department_id: int
+    name: str
+    rank: int
+    href: str
+
+
+class AisleSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    aisle_id: int
+    name: str
+    rank: int
+    department_id: int
+    href: str
+
+
+class ProductSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    product_id: int
+    name: str
+    rank: int
+    size: str | None
+    src: str | None
+    alt: str | None
+    price: str | None
+    affix: str | None
+    price_per: str | None
+    price_cents: int | None
+    price_per_cents: int | None
+    aisle_id: int
+    href: str
+
+
+class SectionSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    section_type: SectionType
+    parent_product_id: int
+    child_product_id: int
+
+
+# SectionType name -> child products
+SectionsSchema = dict[str, list[ProductSchema]]
+
+
+class ProductWithSections(ProductSchema):
+    sections: SectionsSchema
+
+
+class ProductBatch(BaseModel):
+    # in the requested order
+    products: list[ProductWithSections | ProductSchema]
+    # requested ids without a product
+    missing: list[int]
+
+
+class ProductSuggestion(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    product_id: int
+    name: str
+    rank: int
+
+
+class SectionRecommendation(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    product_id: int
+    depth: int
+    score: float
+
+
+class AisleWithProducts(AisleSchema):
+    products: list[ProductSchema]
+
+
+class DepartmentWithAisles(DepartmentSchema):
+    aisles: list[AisleSchema]
+
+
+class DepartmentWithProducts(DepartmentSchema):
+    aisles: list[AisleWithProducts]
+
+
+BulkStatus = Literal["created", "updated", "unchanged", "error"]
+
+
+class BulkItemResult(BaseModel):
+    # position of the item in the request
+    index: int
+    status: BulkStatus
+    detail: str | None = None
+
+
+class BulkResult(BaseModel):
+    results: list[BulkItemResult]
+    created: int
+    updated: int
+    unchanged: int
+    errors: int
+
+
+# a response restricted to the fields in its fields= query parameter
+SparseFields = dict[str, Any]
+
+
+class Page(BaseModel, Generic[T]):
+    items: list[T]
+    next: str | None
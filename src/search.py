@@ -0,0 +1,165 @@
+"""
+Full text search over the products
+
+products_fts is an SQLite FTS5 index of the name, alt and size of every
+product.  It is an external content table: it stores only the index and
+reads the text from the products table, so the text is not duplicated.
+The triggers below keep it in sync with every insert, update and delete
+of a product, whether it is made by a router or a loader.
+
+The bulk loaders replace many rows at once, and index them in one pass
+with suspended_search_index instead of row by row in the triggers.
+
+Results are ranked with BM25, with a match in the name weighted over a
+match in alt or size.  Lower scores are better.
+"""
+
+import re
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import DDL, Select, column, event, func, literal_column, table
+from sqlalchemy.engine import Connection
+
+from src.models import ProductBase
+
+SEARCH_COLUMNS = ["name", "alt", "size"]
+# BM25 weight of each column in SEARCH_COLUMNS
+SEARCH_WEIGHTS = [10.0, 1.0, 1.0]
+
+products_fts = table(
+    "products_fts",
+    column("rowid"),
+    column("products_fts"),
+    *map(column, SEARCH_COLUMNS),
+)
+
+_columns = ", ".join(SEARCH_COLUMNS)
+_new_values = ", ".join(f"new.{name}" for name in SEARCH_COLUMNS)
+_old_values = ", ".join(f"old.{name}" for name in SEARCH_COLUMNS)
+
+CREATE_SEARCH_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    {_columns},
+    content='products',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+)
+"""
+
+# "delete" removes the old values of a row from an external content index
+SEARCH_TRIGGERS = {
+    "products_fts_insert": f"""
+CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts(rowid, {_columns}) VALUES (new.id, {_new_values});
+END
+""",
+    "products_fts_delete": f"""
+CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, {_columns})
+    VALUES ('delete', old.id, {_old_values});
+END
+""",
+    "products_fts_update": f"""
+CREATE TRIGGER IF NOT EXISTS products_fts_update
+AFTER UPDATE OF id, {_columns} ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, {_columns})
+    VALUES ('delete', old.id, {_old_values});
+    INSERT INTO products_fts(rowid, {_columns}) VALUES (new.id, {_new_values});
+END
+""",
+}
+
+
+def has_search_index(connection: Connection) -> bool:
+    return (
+        connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'products_fts'"
+        ).first()
+        is not None
+    )
+
+
+def create_search_triggers(connection: Connection) -> None:
+    for statement in SEARCH_TRIGGERS.values():
+        connection.exec_driver_sql(statement)
+
+
+def drop_search_triggers(connection: Connection) -> None:
+    for name in SEARCH_TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def rebuild_search_index(connection: Connection) -> None:
+    """Index every row of the products table again"""
+    connection.exec_driver_sql(
+        "INSERT INTO products_fts(products_fts) VALUES ('rebuild')"
+    )
+
+
+def create_search_index(connection: Connection) -> None:
+    """Create the index and its triggers, and index the existing products"""
+    if not has_search_index(connection):
+        connection.exec_driver_sql(CREATE_SEARCH_TABLE)
+        rebuild_search_index(connection)
+    create_search_triggers(connection)
+
+
+@contextmanager
+def suspended_search_index(connection: Connection) -> Iterator[None]:
+    """
+    Write products without the triggers, then rebuild the index once.
+    In the transaction of connection, so other connections never see the
+    products without their index.
+    """
+    drop_search_triggers(connection)
+    yield
+    if not has_search_index(connection):
+        connection.exec_driver_sql(CREATE_SEARCH_TABLE)
+    rebuild_search_index(connection)
+    create_search_triggers(connection)
+
+
+# create_all and drop_all of the products table also create and drop the index
+event.listen(
+    ProductBase.__table__,
+    "after_create",
+    DDL(CREATE_SEARCH_TABLE).execute_if(dialect="sqlite"),
+)
+for _statement in SEARCH_TRIGGERS.values():
+    event.listen(
+        ProductBase.__table__,
+        "after_create",
+        DDL(_statement).execute_if(dialect="sqlite"),
+    )
+event.listen(
+    ProductBase.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS products_fts").execute_if(dialect="sqlite"),
+)
+
+
+def match_query(text: str) -> str | None:
+    """
+    A MATCH expression for the words of text, each as a prefix,
+    e.g. 'choc chip' -> '"choc"* "chip"*', which matches products with a
+    word starting with "choc" and a word starting with "chip".
+    The words are quoted so FTS5 operators in text are taken literally.
+    None when text has no words.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_score():
+    return func.bm25(literal_column("products_fts"), *SEARCH_WEIGHTS)
+
+
+def filter_search(query: Select, product_id_column, match: str) -> Select:
+    """Join the index to a query of products and keep the matching ones"""
+    return query.join(products_fts, products_fts.c.rowid == product_id_column).filter(
+        products_fts.c.products_fts.match(match)
+    )
@@ -0,0 +1,256 @@
+"""
+In-memory graph of the product sections, for multi-hop recommendations
+
+Every section is an edge from its parent product to its child product.
+The edges of each section type are kept in compressed sparse row form:
+the products are numbered 0..n-1, and the children of product i are
+
+    targets[offsets[i]:offsets[i + 1]]
+
+so a product's children are one slice of an array, and the whole graph
+is a few machine integers per edge instead of a Python object per row.
+
+The graph is read from the sections table the first time it is used.
+The section routes update it in place after they commit: the edges
+added or removed since the arrays were built are kept aside, and the
+arrays are built again from the edges in memory once there are
+GRAPH_COMPACT_CHANGES of them.  Deleting a product, aisle or department
+(which deletes sections by cascade), or a write by another worker, reads
+the graph again.
+
+A recommendation walks up to depth hops from a product.  A product
+reached by k paths of h hops scores k * GRAPH_DECAY ** (h - 1), summed
+over the hops, so products close to the start and reached many ways
+rank first.
+"""
+
+import heapq
+import sys
+from array import array
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.catalog_version import catalog_version
+from src.models import Section, SectionType
+
+GRAPH_DECAY = 0.5
+GRAPH_COMPACT_CHANGES = 1024
+MAX_GRAPH_DEPTH = 3
+DEFAULT_RECOMMENDATIONS = 10
+MAX_RECOMMENDATIONS = 100
+
+
+@dataclass(frozen=True)
+class Recommendation:
+    product_id: int
+    # the fewest hops from the product
+    depth: int
+    score: float
+
+
+class SectionGraph:
+    def __init__(self):
+        self.clear()
+        # incremented by every invalidate, so a graph that was being read
+        # while a write committed is not kept
+        self.version = 0
+
+    def clear(self) -> None:
+        self.product_ids = array("q")
+        self.nodes: dict[int, int] = {}
+        self.offsets = {section_type: array("l", [0]) for section_type in SectionType}
+        self.targets = {section_type: array("l") for section_type in SectionType}
+        # the changes since the arrays were built
+        self.added = {section_type: defaultdict(set) for section_type in SectionType}
+        self.removed: set[tuple[SectionType, int, int]] = set()
+        self.changes = 0
+        self.loaded = False
+
+    def invalidate(self) -> None:
+        self.version += 1
+        self.clear()
+
+    async def load(self, db: AsyncSession) -> None:
+        await catalog_version.check(db)
+        if self.loaded:
+            return
+        version = self.version
+        rows = await db.execute(
+            select(
+                Section.section_type,
+                Section.parent_product_id,
+                Section.child_product_id,
+            )
+        )
+        edges = [tuple(row) for row in rows]
+        if version != self.version:
+            return
+        self.build(edges)
+        self.loaded = True
+
+    def node(self, product_id: int) -> int:
+        node = self.nodes.get(product_id)
+        if node is None:
+            node = self.nodes[product_id] = len(self.product_ids)
+            self.product_ids.append(product_id)
+        return node
+
+    def build(self, edges: Iterable[tuple[SectionType, int, int]]) -> None:
+        """The arrays of edges (section_type, parent_product_id, child_product_id)"""
+        edges_by_type = defaultdict(list)
+        for section_type, parent_product_id, child_product_id in edges:
+            edges_by_type[section_type].append(
+                (self.node(parent_product_id), self.node(child_product_id))
+            )
+        size = len(self.product_ids)
+        for section_type in SectionType:
+            type_edges = sorted(edges_by_type[section_type])
+            offsets = array("l", [0]) * (size + 1)
+            for parent, _ in type_edges:
+                offsets[parent + 1] += 1
+            for node in range(size):
+                offsets[node + 1] += offsets[node]
+            self.offsets[section_type] = offsets
+            self.targets[section_type] = array("l", (child for _, child in type_edges))
+            self.added[section_type].clear()
+        self.removed.clear()
+        self.changes = 0
+
+    def children(self, section_type: SectionType, node: int) -> Iterator[int]:
+        offsets = self.offsets[section_type]
+        if node + 1 < len(offsets):
+            targets = self.targets[section_type][offsets[node] : offsets[node + 1]]
+            if self.removed:
+                targets = [
+                    child
+                    for child in targets
+                    if (section_type, node, child) not in self.removed
+                ]
+            yield from targets
+        yield from self.added[section_type].get(node, ())
+
+    def edges(self) -> Iterator[tuple[SectionType, int, int]]:
+        for section_type in SectionType:
+            for node, product_id in enumerate(self.product_ids):
+                for child in self.children(section_type, node):
+                    yield section_type, product_id, self.product_ids[child]
+
+    def has_edge(self, section_type: SectionType, parent: int, child: int) -> bool:
+        return child in self.children(section_type, parent)
+
+    def add(
+        self, section_type: SectionType, parent_product_id: int, child_product_id: int
+    ) -> None:
+        if not self.loaded:
+            # a load in progress may have read the sections before the write
+            self.version += 1
+            return
+        parent = self.node(parent_product_id)
+        child = self.node(child_product_id)
+        if self.has_edge(section_type, parent, child):
+            return
+        if (section_type, parent, child) in self.removed:
+            self.removed.discard((section_type, parent, child))
+        else:
+            self.added[section_type][parent].add(child)
+        self.changed()
+
+    def remove(
+        self, section_type: SectionType, parent_product_id: int, child_product_id: int
+    ) -> None:
+        if not self.loaded:
+            self.version += 1
+            return
+        parent = self.nodes.get(parent_product_id)
+        child = self.nodes.get(child_product_id)
+        if parent is None or child is None:
+            return
+        added = self.added[section_type].get(parent)
+        if added is not None and child in added:
+            added.discard(child)
+        elif self.has_edge(section_type, parent, child):
+            self.removed.add((section_type, parent, child))
+        else:
+            return
+        self.changed()
+
+    def changed(self) -> None:
+        self.changes += 1
+        if self.changes >= GRAPH_COMPACT_CHANGES:
+            edges = list(self.edges())
+            self.product_ids = array("q")
+            self.nodes = {}
+            self.build(edges)
+
+    def recommend(
+        self,
+        product_id: int,
+        depth: int,
+        section_types: Iterable[SectionType] = SectionType,
+        limit: int = DEFAULT_RECOMMENDATIONS,
+    ) -> list[Recommendation]:
+        """The best scored products up to depth hops from product_id"""
+        start = self.nodes.get(product_id)
+        if start is None:
+            return []
+        section_types = list(section_types)
+        scores = defaultdict(float)
+        depths = {}
+        # the number of paths to the products reached by the last hop
+        frontier = {start: 1}
+        expanded = {start}
+        for hop in range(1, depth + 1):
+            reached = defaultdict(int)
+            for node, paths in frontier.items():
+                for section_type in section_types:
+                    for child in self.children(section_type, node):
+                        reached[child] += paths
+            weight = GRAPH_DECAY ** (hop - 1)
+            for node, paths in reached.items():
+                if node != start:
+                    scores[node] += paths * weight
+                    depths.setdefault(node, hop)
+            frontier = {
+                node: paths for node, paths in reached.items() if node not in expanded
+            }
+            expanded.update(frontier)
+        best = heapq.nsmallest(
+            limit,
+            scores,
+            key=lambda node: (-scores[node], depths[node], self.product_ids[node]),
+        )
+        return [
+            Recommendation(self.product_ids[node], depths[node], scores[node])
+            for node in best
+        ]
+
+    def memory_size(self) -> int:
+        """Approximate bytes used by the arrays"""
+        return (
+            sys.getsizeof(self.product_ids)
+            + sys.getsizeof(self.nodes)
+            + sum(sys.getsizeof(offsets) for offsets in self.offsets.values())
+            + sum(sys.getsizeof(targets) for targets in self.targets.values())
+        )
+
+    def stats(self) -> dict:
+        return {
+            "products": len(self.product_ids),
+            "edges": sum(len(targets) for targets in self.targets.values())
+            + sum(
+                len(children)
+                for added in self.added.values()
+                for children in added.values()
+            )
+            - len(self.removed),
+            "changes": self.changes,
+            "bytes": self.memory_size(),
+        }
+
+
+section_graph = SectionGraph()
+catalog_version.on_change(section_graph.invalidate)
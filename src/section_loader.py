@@ -0,0 +1,46 @@
+from typing import Iterable
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models import ProductBase, Section, SectionType
+
+# stay well below SQLite's limit on the number of bound parameters
+CHUNK_SIZE = 500
+
+SectionsDict = dict[str, list[ProductBase]]
+
+
+def empty_sections() -> SectionsDict:
+    return {section_type: [] for section_type in SectionType._member_names_}
+
+
+async def load_sections(
+    db: AsyncSession, product_ids: Iterable[int]
+) -> dict[int, SectionsDict]:
+    """
+    Load the sections of many parent products at once.
+
+    Returns a dictionary
+       key = parent product_id
+       value = "sections" dictionary of SectionType name -> list of products
+
+    The section rows and their child products are read with a single join
+    per CHUNK_SIZE parents, instead of a query for every child like
+    Product.sections.  Sections whose child product does not exist are
+    skipped.
+    """
+    product_ids = list(dict.fromkeys(product_ids))
+    sections = {product_id: empty_sections() for product_id in product_ids}
+    for start in range(0, len(product_ids), CHUNK_SIZE):
+        chunk = product_ids[start : start + CHUNK_SIZE]
+        result = await db.execute(
+            select(Section.parent_product_id, Section.section_type, ProductBase)
+            .join(ProductBase, ProductBase.product_id == Section.child_product_id)
+            .filter(Section.parent_product_id.in_(chunk))
+        )
+        for parent_product_id, section_type, child in result:
+            child.href
+            section = SectionType(section_type).name
+            sections[parent_product_id][section].append(child)
+    return sections
@@ -1,21 +1,40 @@
 from contextlib import ExitStack
-from typing import Generator
+from typing import AsyncGenerator, Generator
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.orm.session import Session
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, StaticPool
 from fastapi.testclient import TestClient
 
 from src.main import app
-from src.database import Base, get_db
+from src.autocomplete import autocomplete_index
+from src.catalog import catalog_cache
+from src.response_cache import response_cache
+from src.section_graph import section_graph
+from src.database import (
+    Base,
+    get_read_db,
+    get_read_sessionmaker,
+    get_write_db,
+    set_query_only,
+)
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./testdb.db"
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./testdb.db"
+READ_ONLY_DATABASE_URL = "sqlite+aiosqlite:///file:./testdb.db?mode=ro&uri=true"
 
 
 @pytest.fixture(scope="function")
 def db(db_url=SQLALCHEMY_DATABASE_URL) -> Generator[Session, None, None]:
-    """Create a new database session with a rollback at the end of the test."""
+    """
+    Create a new database session with empty tables.
+
+    The routers use their own async connections, so the test data has to be
+    committed to be visible to them.  The tables are dropped at the end of
+    the test instead of rolling back a transaction.
+    """
     # Create a SQLAlchemy engine
     engine = create_engine(
         db_url,
@@ -27,26 +46,50 @@ def db(db_url=SQLALCHEMY_DATABASE_URL) -> Generator[Session, None, None]:
     TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
     # Create tables in the database
+    Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
-    connection = engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
+    session = TestingSessionLocal()
     yield session
     session.close()
-    transaction.rollback()
-    connection.close()
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
 
 
 @pytest.fixture(scope="function")
 def client(db) -> Generator[TestClient, None, None]:
-    """Create a test client that uses the override_get_db fixture to return a session."""
+    """
+    Create a test client that overrides the read and write sessions with
+    sessions on the test database.
+    """
+    # NullPool: the TestClient runs the app in its own event loop,
+    # so connections are not shared between loops
+    read_engine = create_async_engine(READ_ONLY_DATABASE_URL, poolclass=NullPool)
+    event.listen(read_engine.sync_engine, "connect", set_query_only)
+    write_engine = create_async_engine(
+        ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool
+    )
+    TestingReadSessionLocal = async_sessionmaker(
+        bind=read_engine, autoflush=False, expire_on_commit=False
+    )
+    TestingWriteSessionLocal = async_sessionmaker(
+        bind=write_engine, autoflush=False, expire_on_commit=False
+    )
+
+    async def override_get_read_db() -> AsyncGenerator[AsyncSession, None]:
+        async with TestingReadSessionLocal() as session:
+            yield session
 
-    def override_get_db():
-        try:
-            yield db
-        finally:
-            db.close()
+    async def override_get_write_db() -> AsyncGenerator[AsyncSession, None]:
+        async with TestingWriteSessionLocal() as session:
+            yield session
 
-    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_read_db
+    app.dependency_overrides[get_write_db] = override_get_write_db
+    app.dependency_overrides[get_read_sessionmaker] = lambda: TestingReadSessionLocal
+    # the responses of a previous test are still cached
+    catalog_cache.invalidate()
+    response_cache.clear()
+    autocomplete_index.invalidate()
+    section_graph.invalidate()
     with TestClient(app) as test_client:
         yield test_client
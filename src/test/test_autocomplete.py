@@ -0,0 +1,64 @@
+from src.autocomplete import SUGGEST_KEY_LENGTH, AutocompleteIndex, name_keys
+
+
+def loaded_index(*products: tuple[int, str, int]) -> AutocompleteIndex:
+    index = AutocompleteIndex()
+    index.loaded = True
+    for product in products:
+        index.add(*product)
+    return index
+
+
+def suggested_ids(index: AutocompleteIndex, prefix: str, limit: int = 10):
+    return [suggestion.product_id for suggestion in index.suggest(prefix, limit)]
+
+
+def test_name_keys():
+    assert name_keys("Ferrero Rocher, Hazelnut") == [
+        "ferrero rocher hazelnut",
+        "rocher hazelnut",
+        "hazelnut",
+    ]
+    assert all(len(key) <= SUGGEST_KEY_LENGTH for key in name_keys("a" * 100))
+
+
+def test_suggest_by_word_prefix_in_rank_order():
+    index = loaded_index(
+        (1, "Ferrero Rocher Hazelnut Chocolates", 3),
+        (2, "Dark Chocolate Bar", 1),
+        (3, "Chocolate Milk", 2),
+        (4, "Cheddar Cheese", 4),
+    )
+    assert suggested_ids(index, "choc") == [2, 3, 1]
+    assert suggested_ids(index, "CHOC", limit=2) == [2, 3]
+    assert suggested_ids(index, "chocolate  milk") == [3]
+    assert suggested_ids(index, "ch") == [2, 3, 1, 4]
+    assert suggested_ids(index, "late") == []
+    assert suggested_ids(index, " ") == []
+
+
+def test_suggest_prefix_longer_than_keys():
+    name = "Kirkland Signature Organic Extra Virgin Olive Oil"
+    index = loaded_index((1, name, 1), (2, name.replace("Olive", "Avocado"), 2))
+    assert suggested_ids(index, name) == [1]
+    assert suggested_ids(index, name[:SUGGEST_KEY_LENGTH]) == [1, 2]
+
+
+def test_add_and_remove():
+    index = loaded_index((1, "Organic Eggs", 1), (2, "Organic Milk", 2))
+    index.add(1, "Free Range Eggs", 1)
+    assert suggested_ids(index, "organic") == [2]
+    assert suggested_ids(index, "free") == [1]
+    index.remove(2)
+    assert suggested_ids(index, "organic") == []
+    assert index.keys == sorted(name_keys("Free Range Eggs"))
+    assert index.stats()["products"] == 1
+
+
+def test_write_during_load_is_not_lost():
+    index = AutocompleteIndex()
+    version = index.version
+    # before the index is loaded, a write invalidates a load in progress
+    index.add(1, "Organic Eggs", 1)
+    assert index.version != version
+    assert index.suggest("organic") == []
@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from src import database
+from src.database import SQLITE_PRAGMAS, get_read_db, read_sqlite_pragmas
+from src.main import app
+from src.models import Department
+from src.test.conftest import SQLALCHEMY_DATABASE_URL
+
+
+def test_sqlite_pragmas_applied_on_connect():
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    with engine.connect() as connection:
+        settings = read_sqlite_pragmas(connection)
+    engine.dispose()
+    assert settings["foreign_keys"] == 1
+    if "journal_mode" in SQLITE_PRAGMAS:
+        assert settings["journal_mode"] == SQLITE_PRAGMAS["journal_mode"].lower()
+
+
+def test_sqlite_profile_from_environment(monkeypatch):
+    monkeypatch.setenv("SQLITE_PROFILE", "performance")
+    monkeypatch.setenv("SQLITE_MMAP_SIZE", "0")
+    pragmas = database.get_sqlite_pragmas()
+    assert pragmas["journal_mode"] == "WAL"
+    assert pragmas["mmap_size"] == "0"
+
+
+def test_sqlite_profile_unknown(monkeypatch):
+    monkeypatch.setenv("SQLITE_PROFILE", "fastest")
+    with pytest.raises(ValueError):
+        database.get_sqlite_pragmas()
+
+
+def test_read_engine_rejects_writes(client: TestClient):
+    override_get_read_db = app.dependency_overrides[get_read_db]
+
+    async def insert_department():
+        async for db in override_get_read_db():
+            db.add(Department(department_id=1, name="Wines", rank=1))
+            await db.commit()
+
+    with pytest.raises(OperationalError, match="readonly"):
+        asyncio.run(insert_department())
@@ -0,0 +1,22 @@
+import re
+from fastapi import status
+from fastapi.testclient import TestClient
+
+
+def test_server_timing_header(client: TestClient):
+    response = client.get("/products/")
+    assert response.status_code == status.HTTP_200_OK
+    server_timing = response.headers["Server-Timing"]
+    match = re.match(
+        r'db;dur=([\d.]+);desc="(\d+) queries", app;dur=([\d.]+)', server_timing
+    )
+    assert match
+    db_duration, count, app_duration = match.groups()
+    # the catalog version for the ETag, then the page
+    assert int(count) == 2
+    assert float(db_duration) <= float(app_duration)
+
+
+def test_server_timing_header_without_queries(client: TestClient):
+    response = client.get("/healthy")
+    assert response.headers["Server-Timing"].startswith('db;dur=0.00;desc="0 queries"')
@@ -0,0 +1,140 @@
+import io
+import json
+import os
+
+from box import Box
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from src.data import load_data
+from src.data.stream_json import JSONStreamReader
+from src.models import Department, Product, Section, SectionType
+from src.search import filter_search, match_query
+
+
+def test_bulk_load_all(db: Session, monkeypatch):
+    products = load_data.get_products_with_rank()
+    parent_id, child_id = list(products.keys())[:2]
+    products_details = Box(
+        {
+            parent_id: {
+                "product_id": parent_id,
+                "alt": "image of the parent",
+                "price": "$1.25\xa0/ lb",
+                "sections": [
+                    {
+                        "name": SectionType.related_items.value,
+                        "products": [{"product_id": child_id}, {"product_id": "1"}],
+                    },
+                    {"name": "Not a section", "products": [{"product_id": child_id}]},
+                ],
+            }
+        }
+    )
+    monkeypatch.setattr(
+        load_data, "get_products_details_if_exists", lambda: products_details
+    )
+
+    counts = load_data.bulk_load_all(db.get_bind())
+    assert counts["products"] == len(products)
+    # the section with an unknown child product is skipped
+    assert counts["sections"] == 1
+
+    # running again updates the rows in place
+    counts = load_data.bulk_load_all(db.get_bind())
+    assert db.query(Product).count() == len(products)
+    assert db.query(Department).count() == counts["departments"]
+    assert db.query(Section).count() == 1
+
+    parent = db.query(Product).filter(Product.product_id == int(parent_id)).first()
+    assert parent.alt == "image of the parent"
+    assert parent.price_per_cents == 125
+    assert parent.price_cents == load_data.parse_price_cents(products[parent_id].price)
+
+    # a product without details keeps the alt and price_per it has
+    products_details = Box(
+        {
+            child_id: {
+                "product_id": child_id,
+                "alt": "image of the child",
+                "price": "$2.50\xa0/ lb",
+                "sections": [],
+            }
+        }
+    )
+    load_data.bulk_load_all(db.get_bind())
+    db.expire_all()
+    parent = db.query(Product).filter(Product.product_id == int(parent_id)).first()
+    assert parent.alt == "image of the parent"
+    assert parent.price_per_cents == 125
+    child = db.query(Product).filter(Product.product_id == int(child_id)).first()
+    assert child.alt == "image of the child"
+    assert child.price_per_cents == 250
+
+    # the search index is rebuilt once the rows are loaded
+    product_ids = db.scalars(
+        filter_search(select(Product.product_id), Product.id, match_query("parent"))
+    ).all()
+    assert product_ids == [int(parent_id)]
+
+
+def test_json_stream_reader():
+    document = json.dumps(
+        {"skip": {"a": [1, "}"]}, "items": {"1": {"x": -1.5e3}, "2": "a}b"}}
+    )
+    reader = JSONStreamReader(io.StringIO(document), chunk_size=3)
+    values = {}
+    for key in reader.items():
+        if key == "items":
+            for item_id in reader.items():
+                values[item_id] = reader.value()
+    assert values == {"1": {"x": -1500.0}, "2": "a}b"}
+
+
+def test_stream_load_all(db: Session, tmp_path):
+    products = load_data.get_products_with_rank()
+    parent_id, child_id = list(products.keys())[:2]
+    products_details_file = tmp_path / "products_details.json"
+    products_details_file.write_text(
+        json.dumps(
+            {
+                parent_id: {
+                    "product_id": parent_id,
+                    "alt": "image of the parent",
+                    "price": "$1.25\xa0/ lb",
+                    "sections": [
+                        {
+                            "name": SectionType.related_items.value,
+                            "products": [
+                                {"product_id": child_id},
+                                {"product_id": "1"},
+                            ],
+                        }
+                    ],
+                }
+            }
+        )
+    )
+    costco_file = os.path.join(load_data.root_path, "costco.json")
+
+    rows = {"departments": [], "aisles": [], "products": []}
+    for name, row in load_data.iter_catalog_rows(costco_file):
+        rows[name].append(row)
+    assert rows["departments"] == load_data.get_department_rows()
+    assert rows["aisles"] == load_data.get_aisle_rows()
+
+    counts = load_data.stream_load_all(
+        db.get_bind(), costco_file, str(products_details_file)
+    )
+    # a product listed in several aisles is one row
+    assert counts["products"] == len(products)
+    assert counts["product_details"] == 1
+    # the section with an unknown child product is skipped
+    assert counts["sections"] == 1
+    assert db.query(Product).count() == len(products)
+    assert db.query(Department).count() == counts["departments"]
+
+    parent = db.query(Product).filter(Product.product_id == int(parent_id)).first()
+    assert parent.alt == "image of the parent"
+    assert parent.price_per_cents == 125
+    assert parent.rank == products[parent_id].rank
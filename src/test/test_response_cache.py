@@ -0,0 +1,53 @@
+from src.response_cache import ResponseCache, entity_tags
+
+
+def test_entity_tags():
+    data = {
+        "department_id": 1,
+        "aisles": [
+            {"aisle_id": 101, "products": [{"product_id": 1001, "aisle_id": 101}]}
+        ],
+    }
+    assert entity_tags(data) == {"department:1", "aisle:101", "product:1001"}
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", 1, [])
+    cache.set("b", 2, [])
+    assert cache.get("a").value == 1
+    cache.set("c", 3, [])
+    # "b" is the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a").value == 1
+    assert cache.get("c").value == 3
+    assert cache.stats.evictions == 1
+    assert cache.stats.hits == 3
+    assert cache.stats.misses == 1
+
+
+def test_ttl_expiration(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("src.response_cache.time.monotonic", lambda: now)
+    cache = ResponseCache(ttl=10)
+    cache.set("a", 1, [])
+    now += 5
+    assert cache.get("a").value == 1
+    now += 5
+    assert cache.get("a") is None
+    assert cache.stats.expirations == 1
+
+
+def test_invalidate_by_tag():
+    cache = ResponseCache()
+    cache.set("aisle", 1, ["aisle:677"])
+    cache.set("product", 2, ["aisle:677", "product:112770135"])
+    cache.set("other", 3, ["aisle:678"])
+    cache.invalidate(["product:112770135"])
+    assert cache.get("product") is None
+    assert cache.get("aisle").value == 1
+    cache.invalidate(["aisle:677"])
+    assert cache.get("aisle") is None
+    assert cache.get("other").value == 3
+    assert cache.stats.invalidations == 2
+    assert "aisle:677" not in cache.keys_by_tag
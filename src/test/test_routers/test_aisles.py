@@ -183,3 +183,86 @@ def test_delete_aisle_not_found(
     fake_aisle_id = last_aisle.aisle_id + 1
     response = client.delete(f"/aisles/{fake_aisle_id}")
     assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_create_aisles_bulk(client: TestClient, test_departments: Box, db: Session):
+    request_data = [
+        {"aisle_id": 103, "department_id": 1, "name": "Sparkling Wines", "rank": 3},
+        {"aisle_id": 104, "department_id": 9, "name": "No Department", "rank": 4},
+        {"aisle_id": 101, "department_id": 1, "name": "Reds", "rank": 1},
+        {"aisle_id": 201, "department_id": 2, "name": "TVs", "rank": 1},
+    ]
+    response = client.post("/aisles/bulk", json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+    result = Box(response.json())
+    assert [item.status for item in result.results] == [
+        "created",
+        "error",
+        "error",
+        "created",
+    ]
+    assert db.query(Aisle).filter(Aisle.aisle_id.in_([103, 201])).count() == 2
+
+    response = client.post("/aisles/bulk?upsert=true", json=request_data[2:3])
+    assert Box(response.json()).updated == 1
+    db.expire_all()
+    assert db.query(Aisle).filter(Aisle.aisle_id == 101).first().name == "Reds"
+
+
+def test_patch_aisle(client: TestClient, test_departments: Box, db: Session):
+    response = client.patch("/aisles/101", json={"name": "Reds"})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    aisle = db.query(Aisle).filter(Aisle.aisle_id == 101).first()
+    assert aisle.name == "Reds"
+    assert aisle.rank == test_departments[0].aisles[0].rank
+
+    response = client.patch("/aisles/101", json={"department_id": 9})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = client.patch("/aisles/999", json={"name": "Missing"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_read_aisles_fields(client: TestClient, test_departments: Box):
+    response = client.get("/aisles/by_department/1", params={"fields": "name,href"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()[0] == {
+        "aisle_id": 101,
+        "name": "Red Wines",
+        "href": "costco/departments/1/aisles/101",
+    }
+    response = client.get("/aisles/102", params={"fields": "rank"})
+    assert response.json() == {
+        "aisle_id": 102,
+        "rank": test_departments[0].aisles[1].rank,
+    }
+    response = client.get("/aisles/", params={"fields": "products"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_read_aisle_response_shape(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    aisle = client.get("/aisles/101").json()
+    assert isinstance(aisle.pop("id"), int)
+    assert aisle == {
+        "aisle_id": 101,
+        "name": "Red Wines",
+        "rank": 1,
+        "department_id": 1,
+        "href": "costco/departments/1/aisles/101",
+    }
+
+    aisle = client.get("/aisles/101?with_products=true").json()
+    assert list(aisle) == [
+        "id",
+        "aisle_id",
+        "name",
+        "rank",
+        "department_id",
+        "href",
+        "products",
+    ]
+    product = aisle["products"][0]
+    assert "sections" not in product
+    assert product["price_cents"] == 1669
+    assert product["href"] == "/store/items/item1001"
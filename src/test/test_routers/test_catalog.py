@@ -0,0 +1,58 @@
+from fastapi import status
+from fastapi.testclient import TestClient
+from box import BoxList
+from src.models import Department
+from src.routers.catalog import accepts_gzip
+
+
+def test_read_catalog(client: TestClient, test_departments: BoxList[Department]):
+    response = client.get("/catalog", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == status.HTTP_200_OK
+    assert "content-encoding" not in response.headers
+    assert BoxList(response.json()) == test_departments
+    assert len(response.json()[0]["aisles"][0]["products"]) == 2
+
+
+def test_read_catalog_gzip(client: TestClient, test_departments: BoxList[Department]):
+    response = client.get("/catalog", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert BoxList(response.json()) == test_departments
+
+
+def test_read_catalog_is_cached(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    response = client.get("/catalog")
+    assert response.headers["server-timing"].startswith("db;dur=")
+    # the catalog version, then one query per table
+    assert '"4 queries"' in response.headers["server-timing"]
+    response = client.get("/catalog")
+    assert '"1 queries"' in response.headers["server-timing"]
+
+
+def test_read_catalog_invalidated_by_write(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    catalog = client.get("/catalog").json()
+    department = test_departments[1]
+    request = {
+        "department_id": department.department_id,
+        "name": "Renamed",
+        "rank": department.rank,
+    }
+    response = client.put(f"/departments/{department.department_id}", json=request)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    updated_catalog = client.get("/catalog").json()
+    assert updated_catalog[1]["name"] == "Renamed"
+    assert updated_catalog[0] == catalog[0]
+
+
+def test_accepts_gzip():
+    assert accepts_gzip("gzip, deflate, br")
+    assert accepts_gzip("br;q=1.0, gzip;q=0.8")
+    assert accepts_gzip("*")
+    assert not accepts_gzip("")
+    assert not accepts_gzip("identity")
+    assert not accepts_gzip("gzip;q=0")
@@ -0,0 +1,47 @@
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from box import BoxList
+from src.catalog_version import bump_catalog_version
+from src.models import CatalogVersion, Department
+
+
+def rename_department(db: Session, department_id: int, name: str) -> None:
+    """A write that the events of this worker do not see"""
+    db.execute(
+        text("UPDATE departments SET name = :name WHERE department_id = :id"),
+        {"name": name, "id": department_id},
+    )
+
+
+def test_write_increments_version(
+    client: TestClient, db: Session, test_departments: BoxList[Department]
+):
+    version = db.scalar(select(CatalogVersion.version))
+    department = test_departments[0]
+    request = {"department_id": department.department_id, "name": "x", "rank": 1}
+    response = client.put(f"/departments/{department.department_id}", json=request)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    db.expire_all()
+    assert db.scalar(select(CatalogVersion.version)) == version + 1
+
+
+def test_write_by_another_worker_clears_caches(
+    client: TestClient, db: Session, test_departments: BoxList[Department]
+):
+    department_id = test_departments[0].department_id
+    assert client.get("/departments/").json()[0]["name"] == "Wines"
+    assert client.get("/catalog").json()[0]["name"] == "Wines"
+
+    rename_department(db, department_id, "Cached")
+    db.commit()
+    # the version did not change, the cached responses are served
+    assert client.get("/departments/").json()[0]["name"] == "Wines"
+    assert client.get("/catalog").json()[0]["name"] == "Wines"
+
+    rename_department(db, department_id, "Renamed")
+    bump_catalog_version(db.connection())
+    db.commit()
+    assert client.get("/departments/").json()[0]["name"] == "Renamed"
+    assert client.get("/catalog").json()[0]["name"] == "Renamed"
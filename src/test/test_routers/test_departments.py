@@ -59,6 +59,16 @@ def test_read_department_with_aisles_and_products(
     assert len(actual_department.aisles[0].products) == 2
 
 
+def test_read_department_with_aisles_and_products_queries(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    department_id = test_departments[0].department_id
+    response = client.get(f"/departments/{department_id}?with_aisles_and_products=true")
+    # the catalog version, then one query per level, the sections of the
+    # products are not loaded
+    assert '"4 queries"' in response.headers["server-timing"]
+
+
 def test_create_department(client: TestClient, db: Session):
     request_data = {"department_id": 1, "name": "Wines", "rank": 1}
     response = client.post("/departments", json=request_data)
@@ -116,3 +126,72 @@ def test_delete_department_not_found(client: TestClient, db: Session):
     response = client.delete(f"/departments/{department_id}")
     assert response.status_code == status.HTTP_404_NOT_FOUND
     assert response.json() == {"detail": "Department not found."}
+
+
+def test_patch_department(
+    test_departments: BoxList[Department], client: TestClient, db: Session
+):
+    response = client.patch("/departments/2", json={"name": "TVs", "rank": 5})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    department = db.query(Department).filter(Department.department_id == 2).first()
+    assert (department.name, department.rank) == ("TVs", 5)
+    response = client.get("/departments/2")
+    assert response.json()["name"] == "TVs"
+
+
+def test_patch_department_not_found(client: TestClient, db: Session):
+    response = client.patch("/departments/1", json={"name": "Wines"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "Department not found."}
+
+
+def test_read_departments_fields(client: TestClient, test_departments: BoxList):
+    response = client.get("/departments/", params={"fields": "name"})
+    assert response.json() == [
+        {"department_id": 1, "name": "Wines"},
+        {"department_id": 2, "name": "Electronics"},
+    ]
+    response = client.get("/departments/2", params={"fields": "rank"})
+    assert response.json() == {"department_id": 2, "rank": 2}
+    response = client.get(
+        "/departments/1", params={"fields": "name", "with_aisles": True}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_read_department_response_shape(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    department = client.get("/departments/1").json()
+    assert isinstance(department.pop("id"), int)
+    assert department == {
+        "department_id": 1,
+        "name": "Wines",
+        "rank": 1,
+        "href": "costco/departments/1",
+    }
+
+    department = client.get("/departments/1?with_aisles_and_products=true").json()
+    assert list(department) == [
+        "id",
+        "department_id",
+        "name",
+        "rank",
+        "href",
+        "aisles",
+    ]
+    aisle = department["aisles"][0]
+    assert list(aisle) == [
+        "id",
+        "aisle_id",
+        "name",
+        "rank",
+        "department_id",
+        "href",
+        "products",
+    ]
+    assert "department" not in aisle
+    product = aisle["products"][0]
+    assert "sections" not in product
+    assert "aisle" not in product
+    assert product["href"] == "/store/items/item1001"
@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+from fastapi import status
+from fastapi.testclient import TestClient
+from box import BoxList
+from src.models import SectionType, utcnow
+from src.routers import export
+
+
+def product_ids(departments: BoxList) -> list[int]:
+    return sorted(
+        product.product_id
+        for department in departments
+        for aisle in department.aisles
+        for product in aisle.products
+    )
+
+
+def test_export_products_ndjson(
+    client: TestClient, test_departments: BoxList, monkeypatch
+):
+    # several batches
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 3)
+    response = client.get("/export/products")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["product_id"] for row in rows] == product_ids(test_departments)
+    assert rows[0]["price_cents"] == 1669
+    assert all(row["updated_at"] for row in rows)
+
+
+def test_export_sections_csv(client: TestClient, test_departments_with_sections):
+    response = client.get("/export/sections?format=csv")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 12
+    assert set(rows[0]) == {
+        "section_type",
+        "parent_product_id",
+        "child_product_id",
+        "updated_at",
+    }
+    assert {row["section_type"] for row in rows} == {
+        section_type.value for section_type in SectionType
+    }
+
+
+def test_export_updated_since(client: TestClient, test_departments: BoxList):
+    since = utcnow()
+    product_id = test_departments[0].aisles[0].products[1].product_id
+    response = client.patch(f"/products/{product_id}", json={"price": "$1.00"})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = client.get("/export/products", params={"updated_since": since})
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["product_id"] for row in rows] == [product_id]
+    assert rows[0]["price_cents"] == 100
+
+    response = client.get(
+        "/export/products", params={"updated_since": "2000-01-01T00:00:00Z"}
+    )
+    assert len(response.text.splitlines()) == 4
+
+
+def test_export_invalid_format(client: TestClient):
+    response = client.get("/export/products?format=xml")
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
@@ -0,0 +1,47 @@
+from fastapi import status
+from fastapi.testclient import TestClient
+from box import BoxList
+
+from src.http_cache import etag_matches
+from src.models import Department
+
+
+def test_etag_matches():
+    assert etag_matches('"v2"', '"v2"')
+    assert etag_matches('"v1", W/"v2"', '"v2"')
+    assert etag_matches("*", '"v2"')
+    assert not etag_matches('"v1"', '"v2"')
+
+
+def test_not_modified(client: TestClient, test_departments: BoxList[Department]):
+    url = f"/aisles/{test_departments[0].aisles[0].aisle_id}?with_products=true"
+    response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"].startswith("public")
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    # only the catalog version is read
+    assert '"1 queries"' in response.headers["Server-Timing"]
+
+
+def test_write_changes_etag(client: TestClient, test_departments: BoxList[Department]):
+    etag = client.get("/departments/").headers["ETag"]
+    response = client.put(
+        "/departments/2", json={"department_id": 2, "name": "TVs", "rank": 2}
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = client.get("/departments/", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+
+
+def test_no_etag_on_errors_and_writes(client: TestClient, test_departments_data):
+    response = client.get("/products/1001")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert "ETag" not in response.headers
+    response = client.delete("/products/1001")
+    assert "ETag" not in response.headers
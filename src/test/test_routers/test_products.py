@@ -1,9 +1,19 @@
 import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
+from sqlalchemy import bindparam, event, select
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 from box import Box, BoxList
 from src.models import Department, Product
+from src.pagination import encode_cursor
+from src.product_filters import (
+    ListingShape,
+    full_scan_steps,
+    listing_statement,
+    listing_statements,
+    parse_sort,
+)
 
 
 def test_read_products(client: TestClient, test_departments: BoxList):
@@ -14,8 +24,57 @@ def test_read_products(client: TestClient, test_departments: BoxList):
                 expected_products.append(product)
     response = client.get(f"/products")
     assert response.status_code == status.HTTP_200_OK
-    actual_products = BoxList(response.json())
+    page = Box(response.json())
+    actual_products = page["items"]
     assert len(actual_products) == len(expected_products)
+    assert page.next is None
+
+
+def test_read_products_paginated(client: TestClient, test_departments: BoxList):
+    expected_product_ids = [
+        product.product_id
+        for department in test_departments
+        for aisle in department.aisles
+        for product in aisle.products
+    ]
+    actual_product_ids = []
+    cursor = None
+    while True:
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/products", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        page = Box(response.json())
+        assert len(page["items"]) <= 3
+        actual_product_ids.extend(product.product_id for product in page["items"])
+        cursor = page.next
+        if cursor is None:
+            break
+    assert actual_product_ids == expected_product_ids
+
+
+def test_read_products_invalid_cursor(client: TestClient):
+    response = client.get("/products", params={"cursor": "not a cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize(
+    "url, params, key",
+    [
+        ("/products/", {"sort": "price"}, [{}, 1]),
+        ("/products/", {"sort": "price"}, ["1", 1]),
+        ("/products/", {}, [101, 1, True]),
+        ("/products/", {}, [101, 1.5, 1]),
+        ("/products/search", {"q": "wine"}, [[], 1]),
+        ("/sections/", {}, [1001, {}, 2002]),
+    ],
+)
+def test_read_products_tampered_cursor(
+    client: TestClient, url: str, params: dict, key: list
+):
+    response = client.get(url, params=params | {"cursor": encode_cursor(key)})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
 
 
 def test_read_product(client: TestClient, test_departments: BoxList):
@@ -302,3 +361,491 @@ def test_delete_product_not_found(
     product = aisle.products[product_ids[0]]
     response = client.delete(f"/products/{product.product_id}")
     assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_read_product_with_sections_query_count(
+    client: TestClient, test_departments_with_sections: BoxList
+):
+    product = test_departments_with_sections[0].aisles[0].products[0]
+    response = client.get(f"/products/{product.product_id}?with_sections=true")
+    assert response.status_code == status.HTTP_200_OK
+    # the catalog version, the product, then every section with its child
+    # product in one join
+    assert '"3 queries"' in response.headers["Server-Timing"]
+
+
+def test_product_price_cents(db: Session, test_departments: BoxList[Department]):
+    product = db.query(Product).filter(Product.product_id == 1001).first()
+    assert product.price == "$16.69"
+    assert product.price_cents == 1669
+    assert product.price_per_cents == 1669
+
+
+def test_read_products_sorted_by_price(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    response = client.get("/products", params={"sort": "price", "limit": 1})
+    prices = []
+    while True:
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        prices.extend(product["price_cents"] for product in page["items"])
+        if page["next"] is None:
+            break
+        response = client.get(
+            "/products", params={"sort": "price", "limit": 1, "cursor": page["next"]}
+        )
+    assert prices == [1089, 1359, 1669, 1919]
+
+
+def test_read_products_price_filter(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    response = client.get("/products", params={"min_price": 11, "max_price": 17})
+    assert response.status_code == status.HTTP_200_OK
+    product_ids = [product["product_id"] for product in response.json()["items"]]
+    assert product_ids == [1001, 2002]
+
+
+def test_read_products_by_aisle_price_filter(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    aisle = test_departments[0].aisles[0]
+    response = client.get(
+        f"/products/by_aisle/{aisle.aisle_id}",
+        params={"max_price": 15, "sort": "price"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [product["price"] for product in response.json()] == ["$10.89"]
+    response = client.get(
+        f"/products/by_aisle/{aisle.aisle_id}", params={"min_price": 100}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+
+
+def test_read_products_by_department_sorted_by_price(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    department = test_departments[0]
+    response = client.get(
+        f"/products/by_department/{department.department_id}", params={"sort": "price"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [product["product_id"] for product in response.json()] == [
+        1002,
+        2002,
+        1001,
+        2001,
+    ]
+
+
+def by_department_ids(client: TestClient, **params) -> list[int]:
+    response = client.get("/products/by_department/1", params=params)
+    assert response.status_code == status.HTTP_200_OK
+    return [product["product_id"] for product in response.json()]
+
+
+def test_read_products_by_department_filtered(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    assert by_department_ids(client, price_gte=13.59, price_lt=19.19) == [1001, 2002]
+    assert by_department_ids(client, price_gt=13.59, price_lte=19.19) == [1001, 2001]
+    assert by_department_ids(client, size="750 ML") == [2001, 2002]
+    assert by_department_ids(client, size="ml", affix="each") == [
+        1001,
+        1002,
+        2001,
+        2002,
+    ]
+    assert by_department_ids(client, affix="/lb") == []
+    # % and _ in the text are not wildcards
+    assert by_department_ids(client, size="750_ml") == []
+    assert by_department_ids(client, size="%") == []
+
+
+def test_read_products_by_department_sorted(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    assert by_department_ids(client, sort="-price") == [2001, 1001, 2002, 1002]
+    assert by_department_ids(client, sort="-rank") == [2002, 2001, 1002, 1001]
+    assert by_department_ids(client, sort="name") == [2001, 2002, 1002, 1001]
+    assert by_department_ids(client, sort="-product_id", price_lt=17) == [
+        2002,
+        1002,
+        1001,
+    ]
+    response = client.get(
+        "/products/by_aisle/102", params={"sort": "-price,name", "fields": "price"}
+    )
+    assert response.json() == [
+        {"product_id": 2001, "price": "$19.19"},
+        {"product_id": 2002, "price": "$13.59"},
+    ]
+
+
+@pytest.mark.parametrize("sort", ["size", "price,-price", "", "rank,"])
+def test_read_products_by_department_invalid_sort(
+    client: TestClient, test_departments: BoxList[Department], sort: str
+):
+    response = client.get("/products/by_department/1", params={"sort": sort})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_listing_statement_reused_for_the_same_shape(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    listing_statements.clear()
+    for price in (11, 14, 17):
+        response = client.get("/products/by_aisle/101", params={"price_lt": price})
+        assert response.status_code == status.HTTP_200_OK
+    client.get("/products/by_aisle/102", params={"price_lt": 20})
+    client.get("/products/by_aisle/102", params={"price_lt": 20, "sort": "name"})
+    assert len(listing_statements.statements) == 2
+
+
+def test_full_scan_steps(db: Session):
+    connection = db.connection()
+    anchored = listing_statement(
+        ListingShape("aisle", ("size",), parse_sort("name"), None)
+    )
+    assert full_scan_steps(connection, anchored) == []
+    unanchored = select(Product).filter(Product.size.like(bindparam("size")))
+    assert full_scan_steps(connection, unanchored) == ["SCAN products"]
+
+
+def test_read_products_batch(client: TestClient, test_departments: BoxList):
+    response = client.get("/products/batch", params={"ids": "2001,9999,1001,2001"})
+    assert response.status_code == status.HTTP_200_OK
+    batch = Box(response.json())
+    assert [product.product_id for product in batch.products] == [2001, 1001]
+    assert batch.missing == [9999]
+    assert "sections" not in batch.products[0]
+
+
+def test_read_products_batch_post_with_sections(
+    client: TestClient, test_departments_with_sections: BoxList
+):
+    product_ids = [
+        product.product_id
+        for aisle in test_departments_with_sections[0].aisles
+        for product in aisle.products
+    ]
+    response = client.post(
+        "/products/batch", json={"ids": product_ids, "with_sections": True}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    batch = Box(response.json())
+    assert [product.product_id for product in batch.products] == product_ids
+    assert batch.missing == []
+    expected_product = test_departments_with_sections[0].aisles[0].products[0]
+    assert batch.products[0].sections == expected_product.sections
+    # the products, then the sections of all of them in one join
+    assert '"2 queries"' in response.headers["Server-Timing"]
+
+
+@pytest.mark.parametrize("ids", ["", "1001,abc", ",".join(["1001"] * 101)])
+def test_read_products_batch_invalid_ids(client: TestClient, ids: str):
+    response = client.get("/products/batch", params={"ids": ids})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def search_ids(client: TestClient, **params) -> list[int]:
+    response = client.get("/products/search", params=params)
+    assert response.status_code == status.HTTP_200_OK
+    return [product["product_id"] for product in response.json()["items"]]
+
+
+def test_search_products(client: TestClient, test_departments: BoxList):
+    assert sorted(search_ids(client, q="sauv")) == [1001, 2001]
+    assert search_ids(client, q="Sauvignon napa") == [2001]
+    assert search_ids(client, q="kirkland") == [1002]
+    assert search_ids(client, q="cabernet merlot") == []
+    # FTS5 syntax is taken literally
+    assert search_ids(client, q='chianti OR "napa') == []
+
+
+def test_search_products_filters(client: TestClient, test_departments: BoxList):
+    assert search_ids(client, q="sauv", aisle_id=101) == [1001]
+    assert sorted(search_ids(client, q="750", department_id=1)) == [
+        1001,
+        1002,
+        2001,
+        2002,
+    ]
+    assert search_ids(client, q="750", department_id=2) == []
+
+
+def test_search_products_paginated(client: TestClient, test_departments: BoxList):
+    first = client.get("/products/search", params={"q": "image", "limit": 3}).json()
+    assert len(first["items"]) == 3
+    second = client.get(
+        "/products/search", params={"q": "image", "limit": 3, "cursor": first["next"]}
+    ).json()
+    assert second["next"] is None
+    product_ids = [product["product_id"] for product in first["items"]]
+    product_ids += [product["product_id"] for product in second["items"]]
+    assert sorted(product_ids) == [1001, 1002, 2001, 2002]
+
+
+def test_search_products_without_words(client: TestClient):
+    response = client.get("/products/search", params={"q": "!?"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_search_products_after_writes(client: TestClient, test_departments: BoxList):
+    response = client.patch("/products/1001", json={"name": "Sonoma Zinfandel"})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert search_ids(client, q="zinf") == [1001]
+
+    response = client.delete("/products/1001")
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert search_ids(client, q="zinf") == []
+
+
+def test_suggest_products(client: TestClient, test_departments: BoxList):
+    response = client.get("/products/suggest", params={"prefix": "sauv"})
+    assert response.status_code == status.HTTP_200_OK
+    suggestions = response.json()
+    # the same rank in their aisles, then by name
+    assert [suggestion["product_id"] for suggestion in suggestions] == [2001, 1001]
+    assert suggestions[0]["name"].startswith("Charles Krug")
+
+    # the index is updated by the writes of the routes
+    client.patch("/products/1001", json={"name": "Sonoma Zinfandel"})
+    client.delete("/products/2001")
+    response = client.get("/products/suggest", params={"prefix": "sauv"})
+    assert response.json() == []
+    response = client.get("/products/suggest", params={"prefix": "zin"})
+    assert [suggestion["product_id"] for suggestion in response.json()] == [1001]
+    assert client.get("/cache").json()["autocomplete"]["products"] == 3
+
+
+@pytest.mark.parametrize("url", ["/aisles/102", "/departments/1"])
+def test_suggest_products_after_cascading_delete(
+    client: TestClient, test_departments: BoxList, url: str
+):
+    response = client.get("/products/suggest", params={"prefix": "sauv"})
+    assert len(response.json()) == 2
+    # the products of the aisle or department are deleted by cascade
+    response = client.delete(url)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = client.get("/products/suggest", params={"prefix": "sauv"})
+    expected = [1001] if url.startswith("/aisles") else []
+    assert [suggestion["product_id"] for suggestion in response.json()] == expected
+
+
+def test_suggest_products_query_count(client: TestClient, test_departments: BoxList):
+    client.get("/products/suggest", params={"prefix": "k"})
+    response = client.get("/products/suggest", params={"prefix": "ki"})
+    # only the catalog version once the index is loaded
+    assert '"1 queries"' in response.headers["Server-Timing"]
+
+
+def product_request(product_id: int, aisle_id: int, name: str, price: str = ""):
+    return {
+        "product_id": product_id,
+        "aisle_id": aisle_id,
+        "name": name,
+        "rank": product_id % 100,
+        "src": "",
+        "size": "",
+        "alt": "",
+        "price": price,
+        "price_per": "",
+        "affix": "",
+    }
+
+
+def test_create_products_bulk(
+    client: TestClient, db: Session, test_departments: BoxList[Department]
+):
+    request_data = [
+        product_request(1003, 101, "Bulk Rosé", "$12.99"),
+        product_request(1004, 999, "No Aisle"),
+        product_request(1001, 101, "Already There"),
+        product_request(1003, 102, "Same product_id"),
+        product_request(
+            1005, 102, "Kendall-Jackson Vintner's Reserve Chardonnay White Wine"
+        ),
+        product_request(1006, 102, "Bulk Prosecco"),
+    ]
+    response = client.post("/products/bulk", json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+    result = Box(response.json())
+    assert [item.status for item in result.results] == [
+        "created",
+        "error",
+        "error",
+        "error",
+        "error",
+        "created",
+    ]
+    assert result.created == 2
+    assert result.errors == 4
+    assert "999" in result.results[1].detail
+    product = db.query(Product).filter(Product.product_id == 1003).first()
+    assert product.price_cents == 1299
+    assert db.query(Product).filter(Product.product_id == 1004).first() is None
+    response = client.get("/products/suggest", params={"prefix": "bulk"})
+    assert len(response.json()) == 2
+
+
+def test_upsert_products_bulk(
+    client: TestClient, db: Session, test_departments: BoxList[Department]
+):
+    # warm the response cache, which the upsert must invalidate
+    client.get("/products/by_aisle/102")
+    request_data = [
+        product_request(1001, 102, "Moved Cabernet", "$20.00"),
+        product_request(1007, 102, "New Merlot"),
+    ]
+    response = client.post("/products/bulk?upsert=true", json=request_data)
+    result = Box(response.json())
+    assert [item.status for item in result.results] == ["updated", "created"]
+    db.expire_all()
+    product = db.query(Product).filter(Product.product_id == 1001).first()
+    assert product.name == "Moved Cabernet"
+    assert product.price_cents == 2000
+    aisle_product_ids = [
+        product["product_id"] for product in client.get("/products/by_aisle/102").json()
+    ]
+    assert 1001 in aisle_product_ids
+    assert 1007 in aisle_product_ids
+
+
+def test_create_products_bulk_too_many(client: TestClient):
+    request_data = [product_request(1, 101, str(index)) for index in range(501)]
+    response = client.post("/products/bulk", json=request_data)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_patch_product_fields(
+    client: TestClient, db: Session, test_departments: BoxList[Department]
+):
+    # warm the cached list of the aisle the product is moved to
+    client.get("/products/by_aisle/102")
+    request_data = {"price": "$5.25", "size": None, "affix": "", "aisle_id": 102}
+    response = client.patch("/products/1001", json=request_data)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    # the update, then the catalog version
+    assert '"2 queries"' in response.headers["Server-Timing"]
+    product = db.query(Product).filter(Product.product_id == 1001).first()
+    assert product.price_cents == 525
+    assert product.size is None
+    assert product.affix == ""
+    assert product.updated_at is not None
+    # the fields that were not sent are unchanged
+    assert product.name.startswith("Louis M. Martini")
+    aisle_products = client.get("/products/by_aisle/102").json()
+    assert 1001 in [product["product_id"] for product in aisle_products]
+
+
+def test_patch_product_errors(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    response = client.patch("/products/1001", json={})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = client.patch("/products/1001", json={"name": None})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    name = test_departments[0].aisles[0].products[1].name
+    response = client.patch("/products/1001", json={"name": name})
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+
+def test_read_products_fields(client: TestClient, test_departments: BoxList):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "FROM products" in statement:
+            statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        response = client.get("/products/by_aisle/101?fields=name,price,href")
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    assert response.status_code == status.HTTP_200_OK
+    products = response.json()
+    # the key is always included
+    assert products[0] == {
+        "product_id": 1001,
+        "name": "Louis M. Martini Cabernet Sauvignon, Sonoma County",
+        "price": test_departments[0].aisles[0].products[0].price,
+        "href": "/store/items/item1001",
+    }
+    select_list = statements[0].split("FROM")[0]
+    assert "src" not in select_list
+    assert "alt" not in select_list
+
+
+def test_read_products_fields_paginated(client: TestClient, test_departments: BoxList):
+    params = {"limit": 3, "sort": "price", "fields": "price_cents"}
+    page = client.get("/products", params=params).json()
+    assert page["items"][0] == {"product_id": 1002, "price_cents": 1089}
+    params["cursor"] = page["next"]
+    page = client.get("/products", params=params).json()
+    assert page["items"] == [{"product_id": 2001, "price_cents": 1919}]
+
+
+def test_read_product_fields(client: TestClient, test_departments: BoxList):
+    response = client.get("/products/2001", params={"fields": "aisle_id"})
+    assert response.json() == {"product_id": 2001, "aisle_id": 102}
+    response = client.get(
+        "/products/2001", params={"fields": "aisle_id", "with_sections": True}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = client.get("/products/2001", params={"fields": "name,sections"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+PRODUCT_RESPONSE_FIELDS = [
+    "id",
+    "product_id",
+    "name",
+    "rank",
+    "size",
+    "src",
+    "alt",
+    "price",
+    "affix",
+    "price_per",
+    "price_cents",
+    "price_per_cents",
+    "aisle_id",
+    "href",
+]
+
+
+def test_read_product_response_shape(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    product = client.get("/products/1001").json()
+    assert list(product) == PRODUCT_RESPONSE_FIELDS
+    assert isinstance(product.pop("id"), int)
+    assert product == {
+        "product_id": 1001,
+        "name": "Louis M. Martini Cabernet Sauvignon, Sonoma County",
+        "rank": 1,
+        "size": "750ml",
+        "src": "https://www.instacart.com/assets/domains/product-image/file/large_88f792c4-8e32-4218-a04b-b562c8e40132.jpeg",
+        "alt": "image of Louis M. Martini Cabernet Sauvignon",
+        "price": "$16.69",
+        "affix": "each",
+        "price_per": "$16.69/each",
+        "price_cents": 1669,
+        "price_per_cents": 1669,
+        "aisle_id": 101,
+        "href": "/store/items/item1001",
+    }
+
+    product = client.get("/products/1001?with_sections=true").json()
+    assert list(product) == PRODUCT_RESPONSE_FIELDS + ["sections"]
+    assert list(product["sections"]) == [
+        "featured_products",
+        "related_items",
+        "often_bought_with",
+    ]
+    page = client.get("/products/?limit=1").json()
+    assert list(page) == ["items", "next"]
+    assert list(page["items"][0]) == PRODUCT_RESPONSE_FIELDS
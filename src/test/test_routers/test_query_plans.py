@@ -0,0 +1,104 @@
+import re
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from box import BoxList
+
+from src.models import SectionType
+
+"""
+Every query made by the lookup routes must use an index.
+
+The statements executed by the routers are recorded, then each one is
+run again with EXPLAIN QUERY PLAN.  A "SCAN <table>" step without an
+index means SQLite reads the whole table.
+
+GET /departments/, GET /aisles/ and the exports without updated_since
+return the whole table, so they are not checked.
+"""
+
+FULL_SCAN = re.compile(r"^SCAN \w+$")
+
+
+def lookup_urls(departments: BoxList) -> list[str]:
+    department = departments[0]
+    aisle = department.aisles[0]
+    product = aisle.products[0]
+    section_type = SectionType.featured_products.value
+    child_product_id = product.sections.featured_products[0].product_id
+    return [
+        f"/products/{product.product_id}",
+        f"/products/{product.product_id}?with_sections=true",
+        f"/products/by_aisle/{aisle.aisle_id}",
+        f"/products/by_aisle/{aisle.aisle_id}?sort=price&min_price=1",
+        f"/products/by_department/{department.department_id}",
+        f"/products/by_department/{department.department_id}?price_lt=20&sort=-price,name",
+        f"/products/by_department/{department.department_id}?size=ml&affix=each",
+        f"/products/search?q=sauv&aisle_id={aisle.aisle_id}",
+        f"/products/search?q=sauv&department_id={department.department_id}",
+        f"/aisles/{aisle.aisle_id}",
+        f"/aisles/{aisle.aisle_id}?with_products=true",
+        f"/aisles/by_department/{department.department_id}",
+        f"/departments/{department.department_id}",
+        f"/departments/{department.department_id}?with_aisles=true",
+        f"/departments/{department.department_id}?with_aisles_and_products=true",
+        f"/sections/{section_type}/{product.product_id}/{child_product_id}",
+        f"/sections/by_parent_product_id/{product.product_id}",
+        "/export/products?updated_since=2000-01-01T00:00:00",
+        "/export/sections?updated_since=2000-01-01T00:00:00",
+    ]
+
+
+def paged_urls(client: TestClient) -> list[str]:
+    """The second page of each paginated list, so the cursor is used"""
+    urls = []
+    for url in [
+        "/products/?limit=1",
+        "/products/?limit=1&sort=price",
+        "/sections/?limit=1",
+        "/products/search?q=750&limit=1",
+    ]:
+        cursor = client.get(url).json()["next"]
+        urls.append(f"{url}&cursor={cursor}")
+    return urls
+
+
+@pytest.fixture
+def statements():
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            recorded.append((statement, parameters))
+
+    event.listen(Engine, "before_cursor_execute", record)
+    yield recorded
+    event.remove(Engine, "before_cursor_execute", record)
+
+
+def test_lookup_queries_use_indexes(
+    client: TestClient,
+    db: Session,
+    test_departments_with_sections: BoxList,
+    statements: list,
+):
+    urls = lookup_urls(test_departments_with_sections) + paged_urls(client)
+    statements.clear()
+    for url in urls:
+        response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK, url
+    assert len(statements) >= len(urls)
+
+    connection = db.connection()
+    full_scans = []
+    for statement, parameters in statements:
+        plan = connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        ).all()
+        for row in plan:
+            if FULL_SCAN.match(row.detail):
+                full_scans.append(f"{row.detail}: {statement}")
+    assert full_scans == []
@@ -0,0 +1,98 @@
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from box import BoxList
+from src.models import Department
+
+
+def query_count(response) -> str:
+    """A cached response only reads the catalog version"""
+    return response.headers["server-timing"].split('desc="')[1].split('"')[0]
+
+
+def test_cached_response(client: TestClient, test_departments: BoxList[Department]):
+    aisle_id = test_departments[0].aisles[0].aisle_id
+    before = client.get("/cache").json()
+    first = client.get(f"/aisles/{aisle_id}?with_products=true")
+    second = client.get(f"/aisles/{aisle_id}?with_products=true")
+    assert query_count(first) != "1 queries"
+    assert query_count(second) == "1 queries"
+    assert second.json() == first.json()
+    # the query parameters are part of the key
+    response = client.get(f"/aisles/{aisle_id}")
+    assert query_count(response) != "1 queries"
+    stats = client.get("/cache").json()
+    assert stats["hits"] - before["hits"] == 1
+    assert stats["misses"] - before["misses"] == 2
+    assert stats["entries"] == 2
+
+
+def test_write_invalidates_tagged_responses(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    department = test_departments[0]
+    aisle, other_aisle = department.aisles
+    product = aisle.products[0]
+    urls = [
+        f"/products/{product.product_id}",
+        f"/products/by_aisle/{aisle.aisle_id}",
+        f"/products/by_department/{department.department_id}",
+        f"/departments/{department.department_id}?with_aisles_and_products=true",
+    ]
+    for url in urls:
+        client.get(url)
+    other_aisle_url = f"/products/by_aisle/{other_aisle.aisle_id}"
+    client.get(other_aisle_url)
+
+    response = client.patch(f"/products/{product.product_id}", json={"name": "renamed"})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    for url in urls:
+        response = client.get(url)
+        assert query_count(response) != "1 queries", url
+        assert "renamed" in response.text, url
+    assert query_count(client.get(other_aisle_url)) == "1 queries"
+
+
+def test_create_invalidates_empty_list(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    department = test_departments[1]
+    response = client.get(f"/aisles/by_department/{department.department_id}")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    aisle = {
+        "aisle_id": 201,
+        "name": "new aisle",
+        "rank": 1,
+        "department_id": department.department_id,
+    }
+    response = client.post("/aisles/", json=aisle)
+    assert response.status_code == status.HTTP_201_CREATED
+    response = client.get(f"/aisles/by_department/{department.department_id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert [aisle["aisle_id"] for aisle in response.json()] == [201]
+
+
+@pytest.mark.parametrize("url", ["/aisles/101", "/departments/1"])
+def test_cascading_delete_invalidates_sparse_products(
+    client: TestClient, test_departments: BoxList[Department], url: str
+):
+    # tagged only with the product, the fields leave out its aisle
+    sparse_url = "/products/1001?fields=name"
+    assert client.get(sparse_url).status_code == status.HTTP_200_OK
+    assert query_count(client.get(sparse_url)) == "1 queries"
+
+    response = client.delete(url)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert client.get(sparse_url).status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_moving_an_aisle_invalidates_its_old_department(
+    client: TestClient, test_departments: BoxList[Department]
+):
+    sparse_url = "/products/by_department/1?fields=name"
+    assert len(client.get(sparse_url).json()) == 4
+    response = client.patch("/aisles/102", json={"department_id": 2})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = client.get(sparse_url)
+    assert query_count(response) != "1 queries"
+    assert [product["product_id"] for product in response.json()] == [1001, 1002]
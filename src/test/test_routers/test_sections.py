@@ -23,9 +23,33 @@ def test_read_sections(client: TestClient, test_departments_with_sections: BoxLi
                         )
     response = client.get(f"/sections")
     assert response.status_code == status.HTTP_200_OK
-    actual_sections = BoxList(response.json())
+    page = Box(response.json())
+    actual_sections = page["items"]
     assert len(actual_sections) == len(expected_sections)
     assert actual_sections == expected_sections
+    assert page.next is None
+
+
+def test_read_sections_paginated(
+    client: TestClient, test_departments_with_sections: BoxList
+):
+    response = client.get("/sections")
+    expected_sections = response.json()["items"]
+    actual_sections = []
+    cursor = None
+    while True:
+        params = {"limit": 5}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/sections", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        actual_sections.extend(page["items"])
+        cursor = page["next"]
+        if cursor is None:
+            break
+    assert len(expected_sections) == 12
+    assert actual_sections == expected_sections
 
 
 def test_read_section(client: TestClient, test_departments_with_sections: BoxList):
@@ -157,3 +181,90 @@ def test_delete_section_not_found(
         # json=request_data,
     )
     assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_read_sections_by_product_id(
+    client: TestClient, test_departments_with_sections: BoxList
+):
+    product = test_departments_with_sections[0].aisles[0].products[0]
+    response = client.get(f"/sections/by_parent_product_id/{product.product_id}")
+    assert response.status_code == status.HTTP_200_OK
+    actual_sections = Box(response.json())
+    assert actual_sections == product.sections
+    # the catalog version, then the sections
+    assert '"2 queries"' in response.headers["Server-Timing"]
+
+
+def test_create_sections_bulk(client: TestClient, test_departments: Box, db: Session):
+    featured = SectionType.featured_products.value
+    related = SectionType.related_items.value
+    request_data = [
+        {"section_type": featured, "parent_product_id": 1001, "child_product_id": 1002},
+        {"section_type": related, "parent_product_id": 1001, "child_product_id": 9999},
+        {"section_type": featured, "parent_product_id": 1001, "child_product_id": 1002},
+        {"section_type": related, "parent_product_id": 2001, "child_product_id": 2002},
+    ]
+    response = client.post("/sections/bulk", json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+    result = Box(response.json())
+    assert [item.status for item in result.results] == [
+        "created",
+        "error",
+        "error",
+        "created",
+    ]
+    assert db.query(Section).count() == 2
+
+    response = client.post("/sections/bulk", json=request_data[:1])
+    assert Box(response.json()).errors == 1
+    response = client.post("/sections/bulk?upsert=true", json=request_data[:1])
+    assert Box(response.json()).unchanged == 1
+
+
+def graph_ids(client: TestClient, product_id: int, **params) -> list[int]:
+    response = client.get(f"/sections/graph/{product_id}", params=params)
+    assert response.status_code == status.HTTP_200_OK
+    return [recommendation["product_id"] for recommendation in response.json()]
+
+
+def test_read_section_graph(
+    client: TestClient, test_departments_with_sections: BoxList
+):
+    assert sorted(graph_ids(client, 1001, depth=1)) == [1002, 2001, 2002]
+    assert graph_ids(client, 1001, depth=1, type="often_bought_with") == [2001]
+    response = client.get("/sections/graph/1001", params={"depth": 1, "limit": 1})
+    assert response.json()[0]["depth"] == 1
+    assert len(response.json()) == 1
+    assert graph_ids(client, 9999) == []
+
+
+def test_read_section_graph_validation(client: TestClient):
+    response = client.get("/sections/graph/1001", params={"depth": 4})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = client.get("/sections/graph/1001", params={"type": "Related Items"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_section_graph_follows_writes(client: TestClient, test_departments: Box):
+    featured = SectionType.featured_products.value
+    assert graph_ids(client, 1001) == []
+    for parent_product_id, child_product_id in [(1001, 1002), (1002, 2001)]:
+        response = client.post(
+            "/sections",
+            json={
+                "section_type": featured,
+                "parent_product_id": parent_product_id,
+                "child_product_id": child_product_id,
+            },
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+    assert graph_ids(client, 1001) == [1002, 2001]
+
+    response = client.delete(f"/sections/{featured}/1001/1002")
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert graph_ids(client, 1001) == []
+    assert graph_ids(client, 1002) == [2001]
+
+    response = client.delete("/products/2001")
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert graph_ids(client, 1002) == []
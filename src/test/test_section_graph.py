@@ -0,0 +1,81 @@
+from src.models import SectionType
+from src.section_graph import GRAPH_DECAY, SectionGraph
+
+FEATURED = SectionType.featured_products
+RELATED = SectionType.related_items
+OFTEN = SectionType.often_bought_with
+
+
+def loaded_graph(*edges: tuple[SectionType, int, int]) -> SectionGraph:
+    graph = SectionGraph()
+    graph.build(edges)
+    graph.loaded = True
+    return graph
+
+
+def recommended(graph: SectionGraph, product_id: int, depth: int, *types):
+    return [
+        (recommendation.product_id, recommendation.depth, recommendation.score)
+        for recommendation in graph.recommend(product_id, depth, types or SectionType)
+    ]
+
+
+def test_recommend_ranks_by_paths_and_hops():
+    graph = loaded_graph(
+        (OFTEN, 1, 2),
+        (OFTEN, 1, 3),
+        (OFTEN, 2, 4),
+        (OFTEN, 3, 4),
+        (OFTEN, 1, 8),
+        (OFTEN, 8, 4),
+        (OFTEN, 4, 5),
+        (RELATED, 1, 6),
+        (OFTEN, 2, 1),
+    )
+    assert recommended(graph, 1, 1) == [(2, 1, 1), (3, 1, 1), (6, 1, 1), (8, 1, 1)]
+    # three paths of two hops outrank one of one hop, the start is left out
+    assert recommended(graph, 1, 2, OFTEN) == [
+        (4, 2, 3 * GRAPH_DECAY),
+        (2, 1, 1),
+        (3, 1, 1),
+        (8, 1, 1),
+    ]
+    assert recommended(graph, 1, 3, OFTEN)[-1] == (5, 3, 3 * GRAPH_DECAY**2)
+    assert recommended(graph, 99, 2) == []
+
+
+def test_add_and_remove_edges():
+    graph = loaded_graph((FEATURED, 1, 2), (FEATURED, 2, 3))
+    graph.add(FEATURED, 1, 4)
+    graph.add(FEATURED, 1, 4)
+    graph.add(FEATURED, 4, 7)
+    graph.remove(FEATURED, 2, 3)
+    assert [row[0] for row in recommended(graph, 1, 2)] == [2, 4, 7]
+    graph.add(FEATURED, 2, 3)
+    graph.remove(FEATURED, 1, 4)
+    graph.remove(FEATURED, 8, 9)
+    assert [row[0] for row in recommended(graph, 1, 2)] == [2, 3]
+    assert sorted(graph.edges()) == sorted(
+        [(FEATURED, 1, 2), (FEATURED, 2, 3), (FEATURED, 4, 7)]
+    )
+    assert graph.stats()["edges"] == 3
+
+
+def test_changes_are_compacted(monkeypatch):
+    monkeypatch.setattr("src.section_graph.GRAPH_COMPACT_CHANGES", 3)
+    graph = loaded_graph((RELATED, 1, 2))
+    graph.add(RELATED, 2, 3)
+    graph.remove(RELATED, 1, 2)
+    graph.add(RELATED, 3, 1)
+    assert graph.changes == 0
+    assert not graph.removed
+    assert sorted(graph.edges()) == [(RELATED, 2, 3), (RELATED, 3, 1)]
+    assert [row[0] for row in recommended(graph, 2, 2)] == [3, 1]
+
+
+def test_writes_before_load_are_not_kept():
+    graph = SectionGraph()
+    version = graph.version
+    graph.add(OFTEN, 1, 2)
+    assert graph.version == version + 1
+    assert graph.recommend(1, 1) == []